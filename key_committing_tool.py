@@ -1,136 +1,220 @@
-import re
-from copy import deepcopy
-
-def parse_round_function(func_str, state, block_names, ad_names, ad_counts, ad_start_index):
-    expr = func_str.strip()
-    # Replace state variables with their previous round values
-    for block_index, state_block in enumerate(state):
-        for state_var_index, state_var in enumerate(state_block):
-            expr = expr.replace(f"{block_names[block_index]}{state_var_index}", state_var)
-    
-    # Replace associated data variables with their indexed values
-    for i, (ad_name, ad_count) in enumerate(zip(ad_names, ad_counts)):
-        for ad_num in range(ad_count):
-            if f"{ad_name}{ad_num}" in expr:
-                expr = expr.replace(f"{ad_name}{ad_num}", f"{ad_name}_{ad_start_index[i]}")
-                ad_start_index[i] += 1
-    
-    return expr, ad_start_index
+import json
+import time
+from contextlib import contextmanager, nullcontext
+from key_committing_tool_expr import ZERO, VAR, APPLY, SUM, var, apply_a, add, intern_variable, variable_mask, variable_names, tokenize, parse_expression, as_expression, iter_subterms, contains, remove_subexpression, write_expression, truncated_text, text_length, pack_expressions, unpack_expressions
+from key_committing_tool_gf2 import GF2Basis
 
-def generate_equations(round_functions, block_names, ad_names, ad_counts, num_blocks, num_rounds):
-    # Initialize state variables for each block type
-    state = []
+__version__ = "1.1.0"
+
+class AnalysisStats:
+    # Per-phase timers and counters, filled in when passed to the analysis as stats=.
+    # Phases nest (a guess search includes its propagation), so timers are inclusive.
+    def __init__(self, trace=False):
+        self.timers = {}
+        self.counters = {}
+        self.events = [] if trace else None
+        self.origin = time.perf_counter()
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.timers[name] = self.timers.get(name, 0.0) + elapsed
+            if self.events is not None:
+                self.events.append((name, start - self.origin, elapsed))
+
+    def as_dict(self):
+        return {"timers": dict(self.timers), "counters": dict(self.counters)}
+
+    def write_trace(self, path):
+        # Chrome trace event format (chrome://tracing, Perfetto)
+        events = [{"name": name, "ph": "X", "ts": start * 1e6, "dur": elapsed * 1e6, "pid": 0, "tid": 0} for name, start, elapsed in self.events or ()]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events}, f)
+
+_NO_PHASE = nullcontext()
+
+def phase(stats, name):
+    return stats.phase(name) if stats is not None else _NO_PHASE
+
+STATE_SLOT = 'state'
+AD_SLOT = 'ad'
+
+def _reference_index(name, prefix):
+    # The block or AD number when name is prefix followed by a plain decimal number
+    rest = name[len(prefix):]
+    if name.startswith(prefix) and rest.isdigit() and rest.isascii() and (rest == '0' or rest[0] != '0'):
+        return int(rest)
+    return None
+
+def resolve_reference(name, block_names, num_blocks, ad_names, ad_counts):
+    # Whole identifiers are matched, so S12 is block 12 of S and never S1 followed by 2
+    matches = []
+    problems = []
+    offset = 0
     for block_name, count in zip(block_names, num_blocks):
-        state.append([f"{block_name}_{i}" for i in range(count)])
-    
-    ad_start_index = [0] * len(ad_names)  # Initialize the starting index for each associated data type
-    
-    # Generate equations for each round
-    for round_num in range(1, num_rounds + 1):
-        new_state = [None] * sum(num_blocks)
-        func_index = 0
-        
-        for block_type_index, block_name in enumerate(block_names):
-            for block_index in range(num_blocks[block_type_index]):
-                expr, ad_start_index = parse_round_function(round_functions[func_index], state, block_names, ad_names, ad_counts, ad_start_index)
-                flat_index = sum(num_blocks[:block_type_index]) + block_index
-                new_state[flat_index] = expr
-                func_index += 1
-        
-        # Update the state with the new state for the next round
-        state = []
-        start_idx = 0
-        for count in num_blocks:
-            state.append(new_state[start_idx:start_idx + count])
-            start_idx += count
+        index = _reference_index(name, block_name)
+        if index is not None:
+            if index < count:
+                matches.append((STATE_SLOT, offset + index))
+            else:
+                problems.append(f"{name} is out of range, {block_name} has {count} blocks")
+        offset += count
+    for type_index, (ad_name, ad_count) in enumerate(zip(ad_names, ad_counts)):
+        index = _reference_index(name, ad_name)
+        if index is not None:
+            if index < ad_count:
+                matches.append((AD_SLOT, type_index, index))
+            else:
+                problems.append(f"{name} is out of range, {ad_name} has {ad_count} words per round")
+    if len(matches) > 1:
+        raise ValueError(f"{name} is ambiguous between the block and associated data names")
+    if not matches:
+        raise ValueError(problems[0] if problems else f"unknown variable {name}")
+    return matches[0]
 
-    return new_state
+class RoundFunction:
+    # A round function parsed and checked once. It is kept as postfix code over
+    # numbered slots, so each round only fills the slots with the previous state
+    # and the next AD words and never looks at the text again.
+    def __init__(self, func_str, block_names, num_blocks, ad_names, ad_counts):
+        self.text = func_str.strip()
+        self.ad_names = ad_names
+        references = {}
 
-def extract_variables(expression, block_names, ad_names):
-    variables = set()
-    parts = re.split(r'\+|\(|\)', expression)
-    for part in parts:
-        for name in block_names + ad_names:
-            if part.startswith(name):
-                variables.add(part)
-    return variables
-
-def remove_outer_A(expr):
-    if expr.startswith("A(") and expr.endswith(")"):
-        nested_level = 0
-        for i, char in enumerate(expr[2:-1]):
-            if char == '(':
-                nested_level += 1
-            elif char == ')':
-                nested_level -= 1
-            if nested_level == 0:
-                return expr[2:-1]
-    return expr
-
-def remove_known_values(expr, known_values):
-    parts = re.split(r'(\+|\(|\))', expr)
-    new_parts = []
-    nested_level = 0
-    skip_next_plus = False
-
-    for part in parts:
-        if part == '(':
-            nested_level += 1
-        elif part == ')':
-            nested_level -= 1
-        
-        if nested_level == 0 and part.strip() in known_values:
-            skip_next_plus = True
-            continue
+        def lookup(name):
+            if name not in references:
+                references[name] = resolve_reference(name, block_names, num_blocks, ad_names, ad_counts)
+            return var(name)
 
-        if skip_next_plus:
-            skip_next_plus = False
-            if part == '+':
-                continue
-        
-        new_parts.append(part)
+        template = parse_expression(self.text, lookup)
+        self.slot_index = {name: i for i, name in enumerate(references)}
+
+        # The AD words a function uses take the next free indices in order of their number
+        ad_numbers = [sorted(ref[2] for ref in references.values() if ref[0] == AD_SLOT and ref[1] == i) for i in range(len(ad_names))]
+        self.ad_numbers = ad_numbers
+        self.sources = []
+        for ref in references.values():
+            if ref[0] == STATE_SLOT:
+                self.sources.append((STATE_SLOT, ref[1], 0))
+            else:
+                self.sources.append((AD_SLOT, ref[1], ad_numbers[ref[1]].index(ref[2])))
+        self.ad_used = [len(numbers) for numbers in ad_numbers]
 
-    new_expr = ''.join(new_parts).strip('+')
-    return new_expr
+        self.code = []
+        self.compile(template)
 
-def solve_equation(equations, known_values, unknown_values, block_names, ad_names):
-    new_equations = []
-    for eq in equations:
-        if '=' in eq:
-            lhs, rhs = eq.split('=')
-            rhs = rhs.strip()
-            new_equations.append(rhs)
+    def compile(self, node):
+        if node.kind == VAR:
+            self.code.append((VAR, self.slot_index[node.name]))
+        elif node.kind == APPLY:
+            self.compile(node.args[0])
+            self.code.append((APPLY, 1))
         else:
-            new_equations.append(eq.strip())
+            for term in node.args:
+                self.compile(term)
+            self.code.append((SUM, len(node.args)))
 
-    simplified_equations = deepcopy(new_equations)
-    
-    for i, rhs in enumerate(simplified_equations):
-        # While loop to repeatedly simplify the equation
-        while True:
-            old_rhs = rhs
-            # Remove known values outside of A
-            rhs = remove_known_values(rhs, known_values)
-            # Remove outer A if present
-            rhs = remove_outer_A(rhs)
-            if rhs == old_rhs:
-                break
-        
-        simplified_equations[i] = rhs
-    
-    single_unknown = []
-    for i, rhs1 in enumerate(simplified_equations):
-        for j, rhs2 in enumerate(simplified_equations):
-            if i != j and rhs1 in rhs2:
-                remaining = rhs2.replace(rhs1, '').strip()
-                variables = extract_variables(remaining, block_names, ad_names)
-                unknowns = variables & unknown_values
-                if len(unknowns) == 1 and list(unknowns)[0] not in single_unknown:
-                    single_unknown.append(list(unknowns)[0])
-
-    return single_unknown
-
-def analyze_security(equations, block_names, ad_names, num_blocks, ad_counts, num_rounds):
+    def instantiate(self, state, ad_start_index):
+        # state is the flat list of the previous round's blocks
+        values = [state[index] if kind == STATE_SLOT else var(f"{self.ad_names[index]}_{ad_start_index[index] + offset}") for kind, index, offset in self.sources]
+        stack = []
+        for op, arg in self.code:
+            if op == VAR:
+                stack.append(values[arg])
+            elif op == APPLY:
+                stack[-1] = apply_a(stack[-1])
+            else:
+                terms = stack[len(stack) - arg:]
+                del stack[len(stack) - arg:]
+                stack.append(add(*terms))
+        return stack[0]
+
+def compile_round_functions(round_functions, block_names, num_blocks, ad_names, ad_counts):
+    if len(round_functions) != sum(num_blocks):
+        raise ValueError(f"expected {sum(num_blocks)} round functions, got {len(round_functions)}")
+    compiled = []
+    for i, func_str in enumerate(round_functions):
+        try:
+            compiled.append(RoundFunction(func_str, block_names, num_blocks, ad_names, ad_counts))
+        except ValueError as e:
+            raise ValueError(f"round function {i + 1} ({func_str.strip()}): {e}")
+    return compiled
+
+class RoundUnroller:
+    # Keeps the state of round N so that round N+1 is a single step
+    def __init__(self, round_functions, block_names, ad_names, ad_counts, num_blocks):
+        self.functions = compile_round_functions(round_functions, block_names, num_blocks, ad_names, ad_counts)
+        self.block_names = block_names
+        self.ad_names = ad_names
+        self.ad_counts = ad_counts
+        self.num_blocks = num_blocks
+        self.num_rounds = 0
+
+        # Initialize state variables for each block type
+        self.equations = [var(f"{block_name}_{i}") for block_name, count in zip(block_names, num_blocks) for i in range(count)]
+
+        self.ad_start_index = [0] * len(ad_names)  # Initialize the starting index for each associated data type
+        self.unknown_mask = 0  # variable IDs of the associated data so far
+
+    def step(self):
+        for expr in self.iter_step():
+            pass
+        return self.equations
+
+    def iter_step(self):
+        # Advances one round, yielding each block's new expression as soon as it is built
+        self.num_rounds += 1
+        new_state = []
+        for function in self.functions:
+            expr = function.instantiate(self.equations, self.ad_start_index)
+            for i, used in enumerate(function.ad_used):
+                self.ad_start_index[i] += used
+            new_state.append(expr)
+            yield expr
+        self.equations = new_state
+
+        # Only the associated data of the new round becomes unknown
+        for name, count in zip(self.ad_names, self.ad_counts):
+            for i in range(count * (self.num_rounds - 1), count * self.num_rounds):
+                self.unknown_mask |= 1 << intern_variable(f"{name}_{i}").id
+
+    def all_contain_unknown(self):
+        # Variable masks are cached on the expression nodes, so this does not rescan the equations
+        return all(eq.variable_mask & self.unknown_mask for eq in self.equations)
+
+def generate_equations(round_functions, block_names, ad_names, ad_counts, num_blocks, num_rounds):
+    unroller = RoundUnroller(round_functions, block_names, ad_names, ad_counts, num_blocks)
+    for round_num in range(1, num_rounds + 1):
+        unroller.step()
+    return unroller.equations
+
+def iter_equations(round_functions, block_names, ad_names, ad_counts, num_blocks, num_rounds):
+    # Same equations as generate_equations, yielded one block at a time during the last round
+    unroller = RoundUnroller(round_functions, block_names, ad_names, ad_counts, num_blocks)
+    for round_num in range(1, num_rounds):
+        unroller.step()
+    if num_rounds < 1:
+        yield from unroller.equations
+        return
+    yield from unroller.iter_step()
+
+def extract_variables(expression, block_names, ad_names):
+    prefixes = tuple(block_names + ad_names)
+    return {name for name in variable_names(as_expression(expression).variable_mask) if name.startswith(prefixes)}
+
+def solve_equation(equations, known_values, unknown_values, block_names, ad_names):
+    system = EquationSystem(equations, block_names, ad_names, known_values, unknown_values)
+    solved = system.subterm_index.solve(system.mask(known_values), system.mask(unknown_values))
+    return sorted(system.values(solved))
+
+def initial_values(block_names, ad_names, num_blocks, ad_counts, num_rounds):
     known_values = set()
     unknown_values = set()
     
@@ -142,196 +226,803 @@ def analyze_security(equations, block_names, ad_names, num_blocks, ad_counts, nu
     for name in ad_names:
         for i in range(ad_counts[ad_names.index(name)] * num_rounds):
             unknown_values.add(f"{name}_{i}")
-    
-    num_before = len(known_values)
-    
-    while True:
-        single_unknown = None
-        for eq in equations:
-            if '=' in eq:
-                rhs = eq.split('=')[1].strip()
-            else:
-                rhs = eq.strip()
-            variables = extract_variables(rhs, block_names, ad_names)
-            unknowns = variables & unknown_values
-            if len(unknowns) == 1:
-                single_unknown = list(unknowns)[0]
+    return known_values, unknown_values
+
+class EquationSystem:
+    # Equations compiled once into variable bitmasks; known and unknown values
+    # are bitmasks over the same variable index
+    def __init__(self, equations, block_names, ad_names, known_values, unknown_values, stats=None, relations=()):
+        self.equations = [as_expression(eq) for eq in equations]
+        self.block_names = block_names
+        self.ad_names = ad_names
+        self.stats = stats
+
+        ids = 0
+        for eq in self.equations:
+            ids |= eq.variable_mask
+        prefixes = tuple(block_names + ad_names)
+        variables = {name for name in variable_names(ids) if name.startswith(prefixes)}
+        self.names = sorted(set(known_values) | set(unknown_values) | variables)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        # Symbol table ID -> bit in the masks of this system
+        self.bits = {intern_variable(name).id: i for i, name in enumerate(self.names)}
+        self.ids = variable_mask(self.names)
+        # Relations are sets of values that XOR to zero. They take part in unit
+        # propagation as extra rows after the equations.
+        self.relations = [self.mask(relation) for relation in relations]
+        self.linear_forms = None  # built by propagate_linear on first use
+        self.masks = [self.local_mask(eq.variable_mask) for eq in self.equations] + self.relations
+
+        # For each variable, the equations and relations it appears in
+        self.occurrences = [[] for _ in self.names]
+        for eq_index, mask in enumerate(self.masks):
+            for bit in iter_bits(mask):
+                self.occurrences[bit].append(eq_index)
+        self.subterm_index = SubtermIndex(self)
+
+    def mask(self, names):
+        mask = 0
+        for name in names:
+            mask |= 1 << self.index[name]
+        return mask
+
+    def local_mask(self, ids):
+        # Variable IDs of the symbol table (Expr.variable_mask) to the bits of this system
+        mask = 0
+        for i in iter_bits(ids & self.ids):
+            mask |= 1 << self.bits[i]
+        return mask
+
+    def values(self, mask):
+        return {self.names[i] for i in iter_bits(mask)}
+
+    def propagate_units(self, known, unknown):
+        # Counter-based unit propagation: solving a variable only revisits the
+        # equations that contain it
+        counts = [bin(mask & unknown).count('1') for mask in self.masks]
+        worklist = [eq_index for eq_index, count in enumerate(counts) if count == 1]
+        scanned = len(counts)
+        while worklist:
+            eq_index = worklist.pop()
+            scanned += 1
+            single_unknown = self.masks[eq_index] & unknown
+            if counts[eq_index] != 1 or not single_unknown:
+                continue
+            unknown &= ~single_unknown
+            known |= single_unknown
+            for other in self.occurrences[single_unknown.bit_length() - 1]:
+                counts[other] -= 1
+                if counts[other] == 1:
+                    worklist.append(other)
+        if self.stats is not None:
+            self.stats.count("equations_scanned", scanned)
+        return known, unknown
+
+def iter_bits(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+class SubtermIndex:
+    # Simplified equations indexed by the subterms they contain, so that
+    # finding the equations that contain another equation is a lookup
+    def __init__(self, system):
+        self.system = system
+        self.known = None
+        self.simplified = list(system.equations)
+        self.triggers = [0] * len(system.equations)
+        # Simplifying only looks at the known values of the equation itself, so
+        # the forms are also kept by (equation, its known values) for when the
+        # guess search goes back to a smaller set of known values
+        self.forms = {}
+        self.containing = {}  # subterm node or adjacent (term, term) pair -> equation indices
+        self.keys_cache = {}
+        self.changes_cache = {}
+        self.contains_cache = {}
+        self.remaining_cache = {}
+
+    def simplify(self, expr, known):
+        bits = self.system.bits
+        while True:
+            old_expr = expr
+            # Remove known values outside of A
+            terms = [term for term in expr.terms if not (term.kind == VAR and term.id in bits and known >> bits[term.id] & 1)]
+            expr = add(*terms)
+            # Remove outer A if present
+            if expr.kind == APPLY:
+                expr = expr.args[0]
+            if expr is old_expr:
                 break
+        # Only a top-level variable becoming known can change the result
+        trigger = 0
+        for term in expr.terms:
+            if term.kind == VAR and term.id in bits:
+                trigger |= 1 << bits[term.id]
+        return expr, trigger
+
+    def subterm_keys(self, expr):
+        keys = self.keys_cache.get(expr)
+        if keys is None:
+            keys = set()
+            for sub in iter_subterms(expr):
+                keys.add(sub)
+                if sub.kind == SUM:
+                    keys.update(zip(sub.args, sub.args[1:]))
+            keys = self.keys_cache[expr] = frozenset(keys)
+        return keys
+
+    def key_changes(self, old_expr, new_expr):
+        # The search moves back and forth between the same forms
+        changes = self.changes_cache.get((old_expr, new_expr))
+        if changes is None:
+            old_keys = self.subterm_keys(old_expr)
+            new_keys = self.subterm_keys(new_expr)
+            changes = self.changes_cache[old_expr, new_expr] = (old_keys - new_keys, new_keys - old_keys)
+        return changes
+
+    def sync(self, known):
+        masks = self.system.masks
+        if self.known is None:
+            changed = range(len(self.simplified))
+            grown = False
+        else:
+            differs = known ^ self.known
+            if not differs:
+                return
+            changed = [i for i in range(len(self.simplified)) if masks[i] & differs]
+            grown = known & self.known == self.known
+        resimplified = 0
+        for i in changed:
+            # Simplifying further from the cached forms is the same as starting over
+            if grown and not self.triggers[i] & differs:
+                continue
+            key = (i, known & masks[i])
+            form = self.forms.get(key)
+            if form is None:
+                source = self.simplified[i] if grown else self.system.equations[i]
+                form = self.forms[key] = self.simplify(source, known)
+                resimplified += 1
+            old_expr = self.simplified[i]
+            new_expr, self.triggers[i] = form
+            if self.known is None:
+                new_keys = self.subterm_keys(new_expr)
+            elif new_expr is old_expr:
+                continue
+            else:
+                # The two forms mostly share their subterms, so only the difference is reindexed
+                removed, new_keys = self.key_changes(old_expr, new_expr)
+                for key in removed:
+                    self.containing[key].discard(i)
+            for key in new_keys:
+                self.containing.setdefault(key, set()).add(i)
+            self.simplified[i] = new_expr
+        if self.system.stats is not None:
+            self.system.stats.count("equations_resimplified", resimplified)
+        self.known = known
+
+    def candidates(self, pattern):
+        if pattern is ZERO:
+            return range(len(self.simplified))
+        found = set(self.containing.get(pattern, ()))
+        if pattern.kind == SUM:
+            found |= self.containing.get(pattern.args[:2], set())
+        return found
+
+    def solve(self, known, unknown):
+        # Equation i is known, so if it occurs inside equation j, what is left of j is known too
+        self.sync(known)
+        stats = self.system.stats
+        solved = 0
+        for i, rhs1 in enumerate(self.simplified):
+            for j in self.candidates(rhs1):
+                if i == j:
+                    continue
+                rhs2 = self.simplified[j]
+                key = (rhs2, rhs1)
+                if key not in self.contains_cache:
+                    self.contains_cache[key] = contains(rhs2, rhs1)
+                    if stats is not None:
+                        stats.count("subterm_matches_tried")
+                elif stats is not None:
+                    stats.count("subterm_match_cache_hits")
+                if not self.contains_cache[key]:
+                    continue
+                if key not in self.remaining_cache:
+                    remaining = remove_subexpression(rhs2, rhs1)
+                    self.remaining_cache[key] = self.system.local_mask(remaining.variable_mask)
+                unknowns = self.remaining_cache[key] & unknown
+                if unknowns and unknowns & (unknowns - 1) == 0:
+                    solved |= unknowns
+        return solved
+
+class AnalysisCancelled(Exception):
+    # Raised by a progress callback to stop an analysis that is in progress
+    pass
+
+def propagate(system, known, unknown, progress=None):
+    # Resolve unknowns until no rule applies any more
+    stats = system.stats
+    while True:
+        if stats is not None:
+            stats.count("fixpoint_iterations")
+        with phase(stats, "unit_propagation"):
+            known, unknown = system.propagate_units(known, unknown)
+        if progress is not None:
+            progress("propagate", unknowns=bin(unknown).count('1'))
+        if not unknown:
+            break
         
-        if single_unknown:
-            unknown_values.remove(single_unknown)
-            known_values.add(single_unknown)
-            continue
-        
-        solved_value = solve_equation(equations, known_values, unknown_values, block_names, ad_names)
-        if len(solved_value) != 0:
-            for value in solved_value:
-                unknown_values.remove(value)
-                known_values.add(value)
+        with phase(stats, "solve_equation"):
+            solved = system.subterm_index.solve(known, unknown)
+        if solved:
+            unknown &= ~solved
+            known |= solved
             continue
-        
         break
+    return known, unknown
+
+class LinearForms:
+    # Every expression as an XOR of atoms: the variables, which keep their
+    # EquationSystem index, and the A(...) subterms taken as opaque values
+    def __init__(self, system):
+        self.columns = {var(name): i for i, name in enumerate(system.names)}
+        self.inner = {}  # column of an A(...) atom -> form of its argument
+        # Arguments of new A(...) atoms are handled from a worklist, since
+        # nesting them would recurse once per level
+        self.pending = []
+        self.forms = [self.form(eq) for eq in system.equations]
+        while self.pending:
+            col, arg = self.pending.pop()
+            self.inner[col] = self.form(arg)
+
+    def column(self, node):
+        col = self.columns.get(node)
+        if col is None:
+            col = self.columns[node] = len(self.columns)
+            if node.kind == APPLY:
+                self.pending.append((col, node.args[0]))
+        return col
+
+    def form(self, expr):
+        row = 0
+        for term in expr.terms:
+            row ^= 1 << self.column(term)
+        return row
+
+def propagate_linear(system, known, unknown, progress=None):
+    # Gaussian elimination over the known equations and values, alternated with
+    # the rules of propagate until neither resolves anything new
+    stats = system.stats
+    if system.linear_forms is None:
+        with phase(stats, "linear_forms"):
+            system.linear_forms = LinearForms(system)
+    forms = system.linear_forms
+    with phase(stats, "elimination"):
+        basis = GF2Basis.from_rows(forms.forms + system.relations + [1 << i for i in iter_bits(known)], len(forms.columns))
+    if stats is not None:
+        stats.count("linear_atoms", len(forms.columns))
+    pending = set(forms.inner)
+    while True:
+        with phase(stats, "elimination"):
+            # A(e) is known exactly when e is, since A is invertible
+            changed = True
+            while changed:
+                changed = False
+                determined = basis.units()
+                for col in list(pending):
+                    if determined >> col & 1:
+                        basis.add(forms.inner[col])
+                    elif basis.contains(forms.inner[col]):
+                        basis.add(1 << col)
+                    else:
+                        continue
+                    pending.discard(col)
+                    changed = True
+            solved = basis.units() & unknown
+        known |= solved
+        unknown &= ~solved
+        if progress is not None:
+            progress("linear", unknowns=bin(unknown).count('1'))
+
+        new_known, unknown = propagate(system, known, unknown, progress)
+        if new_known == known:
+            return known, unknown
+        for i in iter_bits(new_known & ~known):
+            basis.add(1 << i)
+        known = new_known
+
+BACKENDS = ("propagation", "linear")
+
+def backend_solver(backend):
+    # backend="linear" also combines any number of equations by Gaussian elimination over GF(2)
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+    return propagate_linear if backend == "linear" else propagate
+
+def analyze_security(equations, block_names, ad_names, num_blocks, ad_counts, num_rounds, progress=None, stats=None, backend="propagation"):
+    solver = backend_solver(backend)
+    known_values, unknown_values = initial_values(block_names, ad_names, num_blocks, ad_counts, num_rounds)
+    with phase(stats, "compile"):
+        system = EquationSystem(equations, block_names, ad_names, known_values, unknown_values, stats)
+    
+    num_before = len(known_values)
+    
+    with phase(stats, "propagate"):
+        known, unknown = solver(system, system.mask(known_values), system.mask(unknown_values), progress=progress)
+    known_values = system.values(known)
+    unknown_values = system.values(unknown)
     
     if not unknown_values:
         return 64 * (sum(num_blocks) - (len(known_values) - num_before))  # All unknowns resolved
     return unknown_values  # Return unresolved unknowns
 
+class RoundLimitExceeded(ValueError):
+    # The scheme needs more rounds than max_rounds allows
+    pass
+
+def unroll_minimum_rounds(block_names, ad_names, num_blocks, ad_counts, round_functions, max_rounds=None, progress=None, stats=None):
+    unroller = RoundUnroller(round_functions, block_names, ad_names, ad_counts, num_blocks)
+    with phase(stats, "unroll"):
+        while True:
+            if max_rounds is not None and unroller.num_rounds >= max_rounds:
+                raise RoundLimitExceeded(f"Some equation still has no unknown value after {max_rounds} rounds")
+            unroller.step()
+            if progress is not None:
+                progress("unroll", round=unroller.num_rounds)
+
+            # Check if all equations contain at least one unknown value
+            if unroller.all_contain_unknown():
+                return unroller.num_rounds, unroller.equations
+
 def find_minimum_rounds(block_names, ad_names, num_blocks, ad_counts, round_functions):
-    num_rounds = 1
-    while True:
-        equations = generate_equations(round_functions, block_names, ad_names, ad_counts, num_blocks, num_rounds)
-        
-        # Initialize unknown_values for the current num_rounds
-        unknown_values = set()
-        for name in ad_names:
-            for i in range(ad_counts[ad_names.index(name)] * num_rounds):
-                unknown_values.add(f"{name}_{i}")
+    num_rounds, _ = unroll_minimum_rounds(block_names, ad_names, num_blocks, ad_counts, round_functions)
+    return num_rounds
 
-        # Check if all equations contain at least one unknown value
-        all_contain_unknown = all(any(var in extract_variables(eq, block_names, ad_names) for var in unknown_values) for eq in equations)
+def parse_ad_relation(text, ad_names, ad_counts):
+    # "a0 + b0 = c0": AD words of the same round that XOR to zero, as (AD type, word) pairs
+    words = {}
+    sides = text.split('=')
+    if len(sides) > 2:
+        raise ValueError(f"More than one '=' in AD relation: {text}")
+    for side in sides:
+        tokens = tokenize(side)
+        if not tokens or tokens[0] == '+' or tokens[-1] == '+' or any(a == '+' and b == '+' for a, b in zip(tokens, tokens[1:])):
+            raise ValueError(f"Expected AD words joined by '+' in AD relation: {text}")
+        for token in tokens:
+            if token == '+':
+                continue
+            if token in ('A(', '(', ')'):
+                raise ValueError(f"Unexpected {token!r} in AD relation: {text}")
+            ref = resolve_reference(token, [], [], ad_names, ad_counts)
+            # A word on both sides cancels out
+            words[ref[1:]] = not words.get(ref[1:], False)
+    words = sorted(word for word, present in words.items() if present)
+    if len(words) < 2:
+        raise ValueError(f"An AD relation needs at least two different AD words: {text}")
+    return words
 
-        if all_contain_unknown:
-            return num_rounds
-        
-        num_rounds += 1
+def format_ad_relation(words, ad_names):
+    names = [f"{ad_names[ad_type]}{number}" for ad_type, number in words]
+    return f"{' + '.join(names[:-1])} = {names[-1]}"
 
-def analyze_security_with_guessing(equations, block_names, ad_names, num_blocks, ad_counts, num_rounds):
-    known_values = set()
-    unknown_values = set()
-    
-    # Initialize known values and unknown values
-    for name in block_names:
-        for i in range(num_blocks[block_names.index(name)]):
-            known_values.add(f"{name}_{i}")
-    
-    for name in ad_names:
-        for i in range(ad_counts[ad_names.index(name)] * num_rounds):
-            unknown_values.add(f"{name}_{i}")
-    
-    while True:
-        single_unknown = None
-        for eq in equations:
-            if '=' in eq:
-                rhs = eq.split('=')[1].strip()
-            else:
-                rhs = eq.strip()
-            variables = extract_variables(rhs, block_names, ad_names)
-            unknowns = variables & unknown_values
-            if len(unknowns) == 1:
-                single_unknown = list(unknowns)[0]
-                break
-        
-        if single_unknown:
-            unknown_values.remove(single_unknown)
-            known_values.add(single_unknown)
-            continue
-        
-        solved_value = solve_equation(equations, known_values, unknown_values, block_names, ad_names)
-        if len(solved_value) != 0:
-            for value in solved_value:
-                unknown_values.remove(value)
-                known_values.add(value)
-            continue
-        
-        change = 0
-        if len(ad_names) == 3:
-            for round_num in range(num_rounds):
-                ad0 = f"{ad_names[0]}_{round_num}"
-                ad1 = f"{ad_names[1]}_{round_num}"
-                ad2 = f"{ad_names[2]}_{round_num}"
-                if (ad0 in known_values and ad1 in known_values and ad2 not in known_values):
-                    unknown_values.remove(ad2)
-                    known_values.add(ad2)
-                    change = 1
-                elif (ad0 in known_values and ad2 in known_values and ad1 not in known_values):
-                    unknown_values.remove(ad1)
-                    known_values.add(ad1)
-                    change = 1
-                elif (ad1 in known_values and ad2 in known_values and ad0 not in known_values):
-                    unknown_values.remove(ad0)
-                    known_values.add(ad0)
-                    change = 1
-        if change == 1:
-            continue
-        
-        break
-    
-    unknowns_before_guessing = sorted(list(unknown_values))
-    print(f"Unknown values before guessing: {unknowns_before_guessing}")
+def default_ad_relations(ad_names):
+    # The rule for three AD types used before relations could be declared: ad0 + ad1 = ad2
+    if len(ad_names) == 3:
+        return [format_ad_relation([(0, 0), (1, 0), (2, 0)], ad_names)]
+    return []
 
-    if not unknown_values:
-        return unknowns_before_guessing, []
+def relation_values(relations, ad_names, ad_counts, num_rounds):
+    # One set of value names per relation and round; word k of a round is the
+    # k-th word of its type that the round functions take in that round
+    values = []
+    for relation in relations:
+        words = parse_ad_relation(relation, ad_names, ad_counts)
+        for round_num in range(num_rounds):
+            values.append({f"{ad_names[ad_type]}_{ad_counts[ad_type] * round_num + number}" for ad_type, number in words})
+    return values
+
+class GuessSearch:
+    # Propagation only depends on the set of known values, so search states
+    # are memoized on that bitmask and the guess order is never enumerated twice
+    def __init__(self, system, all_values, progress=None, backend="propagation"):
+        self.system = system
+        self.all_values = all_values
+        self.progress = progress
+        self.solver = backend_solver(backend)
+        self.closures = {}
+        self.solutions = {}
+        self.nodes = 0
+        self.depth = 0  # the current bound, for progress reports
+
+    def closure(self, known, guess):
+        key = (known, guess)
+        if key not in self.closures:
+            self.closures[key], _ = self.solver(self.system, known | guess, self.all_values & ~(known | guess))
+        elif self.system.stats is not None:
+            self.system.stats.count("closure_memo_hits")
+        return self.closures[key]
+
+    def search_from(self, known, budget, start):
+        # All guess sets of at most budget guesses that resolve every unknown,
+        # each only tried with its bits in increasing order from bit start on.
+        # Propagating a set of guesses ends in the same state in any order, so
+        # no set is enumerated twice, and the sets that start with different
+        # guesses can be searched apart.
+        if known == self.all_values:
+            return {0}
+        if budget == 0:
+            return set()
+        stats = self.system.stats
+        key = (known, budget, start)
+        if key not in self.solutions:
+            self.nodes += 1
+            if stats is not None:
+                stats.count("search_nodes")
+            if self.progress is not None:
+                self.progress("guess", depth=self.depth, nodes=self.nodes, unknowns=bin(self.all_values & ~known).count('1'))
+            solutions = set()
+            for bit in iter_bits((self.all_values & ~known) >> start << start):
+                guess = 1 << bit
+                for rest in self.search_from(self.closure(known, guess), budget - 1, bit + 1):
+                    solutions.add(rest | guess)
+            self.solutions[key] = solutions
+        elif stats is not None:
+            stats.count("search_memo_hits")
+        return self.solutions[key]
+
+def find_minimum_guesses(system, known, unknown, progress=None, backend="propagation"):
+    search = GuessSearch(system, known | unknown, progress, backend)
+    # Deepen the bound one guess at a time; the first depth with a solution is
+    # the minimum, so no branch ever goes deeper than the best depth
+    for depth in range(1, bin(unknown).count('1') + 1):
+        search.depth = depth
+        solutions = search.search_from(known, depth, 0)
+        if solutions:
+            return sorted(sorted(system.values(guesses)) for guesses in solutions)
+    return []
+
+# Split off a second guess level when the first gives fewer tasks than this per worker
+GUESS_TASKS_PER_JOB = 4
+
+_guess_worker = None
+
+def _init_guess_worker(packed_equations, block_names, ad_names, names, relations, all_values, backend, bound):
+    global _guess_worker
+    system = EquationSystem(unpack_expressions(*packed_equations), block_names, ad_names, names, (), relations=relations)
+    _guess_worker = GuessSearch(system, all_values, backend=backend), bound
+
+def _guess_task(state, start, num_guessed):
+    # The fewest further guesses from one state of the split levels, or None
+    # once the shared bound shows that other tasks need fewer guesses in total
+    search, bound = _guess_worker
+
+    def check_bound(stage, **info):
+        if num_guessed + search.depth > bound.value:
+            raise AnalysisCancelled()
+
+    search.progress = check_bound
+    for budget in range(bin((search.all_values & ~state) >> start).count('1') + 1):
+        search.depth = budget
+        try:
+            check_bound("guess")
+            solutions = search.search_from(state, budget, start)
+        except AnalysisCancelled:
+            return None
+        if solutions:
+            with bound.get_lock():
+                bound.value = min(bound.value, num_guessed + budget)
+            return budget, solutions
+    return None
+
+def parallel_minimum_guesses(system, known, unknown, jobs, progress=None, backend="propagation"):
+    # Same result as find_minimum_guesses. The first one or two guesses are
+    # expanded here in increasing bit order, and each of the resulting
+    # disjoint subtrees is searched in a worker process. Workers share the
+    # fewest total guesses found so far and drop subtrees that cannot match it.
+    # Only imported here, to keep the module quick to import for the GUI
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    all_values = known | unknown
+    stats = system.stats
+    search = GuessSearch(system, all_values, backend=backend)
+    tasks = [(known, 0, 0)]  # (state, lowest bit left to guess, guesses so far)
+    num_guessed = 0
+    while num_guessed == 0 or (num_guessed < 2 and len(tasks) < GUESS_TASKS_PER_JOB * jobs):
+        next_tasks = []
+        for state, start, guesses in tasks:
+            for bit in iter_bits((all_values & ~state) >> start << start):
+                guess = 1 << bit
+                next_tasks.append((search.closure(state, guess), bit + 1, guesses | guess))
+        tasks = next_tasks
+        num_guessed += 1
+        # Levels are expanded in order, so a solution here is a minimum
+        solved = [guesses for state, _, guesses in tasks if state == all_values]
+        if solved:
+            return sorted(sorted(system.values(guesses)) for guesses in solved)
+    if stats is not None:
+        stats.count("guess_tasks", len(tasks))
+
+    bound = multiprocessing.Value('i', bin(unknown).count('1'))
+    relations = [system.values(relation) for relation in system.relations]
+    # Packed once for all equations, which share most of their nodes
+    initargs = (pack_expressions(system.equations), system.block_names, system.ad_names, system.names, relations, all_values, backend, bound)
+    results = [None] * len(tasks)
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_guess_worker, initargs=initargs) as executor:
+        # The subtrees of the lowest first guesses are the largest, so they are queued first
+        futures = {executor.submit(_guess_task, state, start, num_guessed): i for i, (state, start, _) in enumerate(tasks)}
+        try:
+            for done, future in enumerate(as_completed(futures), 1):
+                results[futures[future]] = future.result()
+                if progress is not None:
+                    progress("guess", depth=bound.value, nodes=done, unknowns=bin(unknown).count('1'))
+        except BaseException:
+            # Running tasks stop at their next search node
+            bound.value = -1
+            executor.shutdown(cancel_futures=True)
+            raise
+
+    # Every guess set comes from exactly one task, so the merged result does
+    # not depend on which worker finished first
+    best = min(num_guessed + result[0] for result in results if result is not None)
+    solutions = set()
+    for (_, _, guesses), result in zip(tasks, results):
+        if result is not None and num_guessed + result[0] == best:
+            solutions.update(rest | guesses for rest in result[1])
+    return sorted(sorted(system.values(guesses)) for guesses in solutions)
+
+GUESS_SOLVERS = ("search", "pysat", "ortools")
+
+def guessing_system(equations, block_names, ad_names, num_blocks, ad_counts, num_rounds, progress=None, stats=None, relations=None, backend="propagation"):
+    # The compiled system with the known and unknown masks that the backend leaves before any guess.
+    # relations are AD relation strings such as "a0 + b0 = c0"; None keeps the three AD type rule.
+    solver = backend_solver(backend)
+    if relations is None:
+        relations = default_ad_relations(ad_names)
+    known_values, unknown_values = initial_values(block_names, ad_names, num_blocks, ad_counts, num_rounds)
+    with phase(stats, "compile"):
+        system = EquationSystem(equations, block_names, ad_names, known_values, unknown_values, stats, relation_values(relations, ad_names, ad_counts, num_rounds))
     
-    min_depth = float('inf')
-    best_guesses = []
-
-    def recursive_guess(known_values, unknown_values, depth, current_guesses):
-        nonlocal min_depth, best_guesses
-        if not unknown_values:
-            if depth < min_depth:
-                min_depth = depth
-                best_guesses = [current_guesses]
-            elif depth == min_depth:
-                best_guesses.append(current_guesses)
-            return True
-        
-        for guess in sorted(unknown_values):
-            new_known = known_values | {guess}
-            new_unknown = unknown_values - {guess}
-            
-            while True:
-                single_unknown = None
-                for eq in equations:
-                    if '=' in eq:
-                        rhs = eq.split('=')[1].strip()
-                    else:
-                        rhs = eq.strip()
-                    variables = extract_variables(rhs, block_names, ad_names)
-                    unknowns = variables & new_unknown
-                    if len(unknowns) == 1:
-                        single_unknown = list(unknowns)[0]
-                        break
-                
-                if single_unknown:
-                    new_unknown.remove(single_unknown)
-                    new_known.add(single_unknown)
-                    continue
-                
-                solved_value = solve_equation(equations, new_known, new_unknown, block_names, ad_names)
-                if len(solved_value) != 0:
-                    for value in solved_value:
-                        new_unknown.remove(value)
-                        new_known.add(value)
-                    continue
-                
-                change = 0
-                if len(ad_names) == 3:
-                    for round_num in range(num_rounds):
-                        ad0 = f"{ad_names[0]}_{round_num}"
-                        ad1 = f"{ad_names[1]}_{round_num}"
-                        ad2 = f"{ad_names[2]}_{round_num}"
-                        if (ad0 in new_known and ad1 in new_known and ad2 not in new_known):
-                            new_unknown.remove(ad2)
-                            new_known.add(ad2)
-                            change = 1
-                        elif (ad0 in new_known and ad2 in new_known and ad1 not in new_known):
-                            new_unknown.remove(ad1)
-                            new_known.add(ad1)
-                            change = 1
-                        elif (ad1 in new_known and ad2 in new_known and ad0 not in new_known):
-                            new_unknown.remove(ad0)
-                            new_known.add(ad0)
-                            change = 1
-                if change == 1:
-                    continue
-                
-                break
+    with phase(stats, "propagate"):
+        known, unknown = solver(system, system.mask(known_values), system.mask(unknown_values), progress)
+    return system, known, unknown
 
-            recursive_guess(new_known, new_unknown, depth + 1, current_guesses + [guess])
+def analyze_guessing(equations, block_names, ad_names, num_blocks, ad_counts, num_rounds, progress=None, stats=None, relations=None, jobs=1, solver="search", time_limit=None, backend="propagation"):
+    # jobs > 1 runs the guess search on that many worker processes. solver="pysat" or
+    # "ortools" hands it to that solver instead, stopping after time_limit seconds if given.
+    # The backend resolves values both before guessing and after each guess.
+    if solver not in GUESS_SOLVERS:
+        raise ValueError(f"Unknown guess solver {solver!r}, expected one of {', '.join(GUESS_SOLVERS)}")
+    system, known, unknown = guessing_system(equations, block_names, ad_names, num_blocks, ad_counts, num_rounds, progress, stats, relations, backend)
     
-    recursive_guess(known_values, unknown_values, 0, [])
+    unknowns_before_guessing = sorted(system.values(unknown))
+    if not unknown:
+        return unknowns_before_guessing, []
+    with phase(stats, "guess_search"):
+        if solver != "search":
+            # Needs an optional solver package, so only imported here
+            from key_committing_tool_sat import solver_minimum_guesses
+            return unknowns_before_guessing, solver_minimum_guesses(system, known, unknown, solver, time_limit, progress, backend)
+        if jobs > 1:
+            return unknowns_before_guessing, parallel_minimum_guesses(system, known, unknown, jobs, progress, backend)
+        return unknowns_before_guessing, find_minimum_guesses(system, known, unknown, progress, backend)
+
+def format_guesses(best_guesses):
     if best_guesses:
-        formatted_guesses = ' or '.join([f"[{', '.join(guess)}]" for guess in best_guesses])
-        return unknowns_before_guessing, formatted_guesses
-    return unknowns_before_guessing, []
+        return ' or '.join([f"[{', '.join(guess)}]" for guess in best_guesses])
+    return []
+
+def analyze_security_with_guessing(equations, block_names, ad_names, num_blocks, ad_counts, num_rounds, stats=None, relations=None, jobs=1):
+    unknowns_before_guessing, best_guesses = analyze_guessing(equations, block_names, ad_names, num_blocks, ad_counts, num_rounds, stats=stats, relations=relations, jobs=jobs)
+    print(f"Unknown values before guessing: {unknowns_before_guessing}")
+    return unknowns_before_guessing, format_guesses(best_guesses)
+
+def format_stats(stats):
+    lines = [f"{name}: {seconds:.4f}s" for name, seconds in stats["timers"].items()]
+    lines += [f"{name}: {count}" for name, count in sorted(stats["counters"].items())]
+    return lines
+
+def equation_labels(block_names, num_blocks):
+    # Generate the equation names in T_{index} format
+    for block_type_index, block_name in enumerate(block_names):
+        for block_index in range(num_blocks[block_type_index]):
+            if len(block_names) == 1:
+                yield f"T_{block_index}"
+            else:
+                yield f"T_{block_name}_{block_index}"
+
+def format_equations(equations, block_names, num_blocks):
+    return [f"{label} = {eq}" for label, eq in zip(equation_labels(block_names, num_blocks), equations)]
+
+def write_equations(equations, block_names, num_blocks, out):
+    # Streams the formatted equations to a file; equations may be any iterable, e.g. iter_equations
+    for i, (label, eq) in enumerate(zip(equation_labels(block_names, num_blocks), equations)):
+        if i:
+            out.write("\n\n")
+        out.write(f"{label} = ")
+        write_expression(eq, out)
+    out.write("\n")
+
+def preview_equations(equations, block_names, num_blocks, max_chars):
+    # Formatted equations cut to a total of about max_chars characters, for display
+    labels = list(equation_labels(block_names, num_blocks))
+    per_equation = max(1000, max_chars // max(len(labels), 1))
+    lengths = {}
+    formatted_equations = []
+    for label, eq in zip(labels, equations):
+        text, truncated = truncated_text(eq, per_equation)
+        if truncated:
+            text += f" ... [{text_length(eq, lengths) - per_equation} more characters]"
+        formatted_equations.append(f"{label} = {text}")
+    return formatted_equations
+
+SCHEME_DEFAULTS = {
+    "AEGIS-128": {
+        "num_block_types": "1",
+        "num_blocks": "5",
+        "block_names": "S",
+        "num_ad_types": "1",
+        "ad_counts": "1",
+        "ad_names": "AD",
+        "round_functions": "A(S4)+S0+AD0\nA(S0)+S1\nA(S1)+S2\nA(S2)+S3\nA(S3)+S4"
+    },
+    "AEGIS-128L": {
+        "num_block_types": "1",
+        "num_blocks": "8",
+        "block_names": "S",
+        "num_ad_types": "1",
+        "ad_counts": "2",
+        "ad_names": "AD",
+        "round_functions": "A(S7)+S0+AD0\nA(S0)+S1\nA(S1)+S2\nA(S2)+S3\nA(S3)+S4+AD1\nA(S4)+S5\nA(S5)+S6\nA(S6)+S7"
+    },
+    "AEGIS-256": {
+        "num_block_types": "1",
+        "num_blocks": "6",
+        "block_names": "S",
+        "num_ad_types": "1",
+        "ad_counts": "1",
+        "ad_names": "AD",
+        "round_functions": "A(S4)+S0+AD0\nA(S0)+S1\nA(S1)+S2\nA(S2)+S3\nA(S3)+S4\nA(S4)+S5"
+    },
+    "Rocca": {
+        "num_block_types": "1",
+        "num_blocks": "8",
+        "block_names": "S",
+        "num_ad_types": "1",
+        "ad_counts": "2",
+        "ad_names": "AD",
+        "round_functions": "S7+AD0\nA(S0)+S7\nS1+S6\nA(S2)+S1\nS3+AD1\nA(S4)+S3\nA(S5)+S4\nS0+S6"
+    },
+    "Rocca-S": {
+        "num_block_types": "1",
+        "num_blocks": "7",
+        "block_names": "S",
+        "num_ad_types": "1",
+        "ad_counts": "2",
+        "ad_names": "AD",
+        "round_functions": "S1+S6\nA(S0)+AD0\nA(S1)+S0\nA(S2)+S6\nA(S3)+AD1\nA(S4)+S3\nA(S5)+S4"
+    },
+    "Tiaoxin-346": {
+        "num_block_types": "3",
+        "num_blocks": "3 4 6",
+        "block_names": "U V W",
+        "num_ad_types": "3",
+        "ad_counts": "1 1 1",
+        "ad_names": "a b c",
+        "round_functions": "U0+a0+A(U2)\nA(U0)\nU1\nV0+b0+A(V3)\nA(V0)\nV1\nV2\nW0+c0+A(W5)\nA(W0)\nW1\nW2\nW3\nW4",
+        "ad_relations": "a0 + b0 = c0"
+    }
+}
+
+def _split_field(value):
+    if isinstance(value, str):
+        return value.strip().split()
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value]
+
+def parse_scheme(fields, name="Custom"):
+    # Accepts the string fields of SCHEME_DEFAULTS or their JSON/YAML list equivalents
+    try:
+        num_blocks = list(map(int, _split_field(fields["num_blocks"])))
+        block_names = [str(block_name) for block_name in _split_field(fields["block_names"])]
+        ad_counts = list(map(int, _split_field(fields["ad_counts"])))
+        ad_names = [str(ad_name) for ad_name in _split_field(fields["ad_names"])]
+        round_functions = fields["round_functions"]
+        if isinstance(round_functions, str):
+            round_functions = round_functions.strip().split('\n')
+        round_functions = [func.strip() for func in round_functions]
+        num_block_types = int(fields.get("num_block_types", len(block_names)))
+        num_ad_types = int(fields.get("num_ad_types", len(ad_names)))
+    except KeyError as e:
+        raise ValueError(f"{name}: missing field {e.args[0]}")
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"{name}: {e}")
+
+    if num_block_types != len(block_names) or len(num_blocks) != len(block_names):
+        raise ValueError(f"{name}: expected {num_block_types} block names and block counts")
+    if num_ad_types != len(ad_names) or len(ad_counts) != len(ad_names):
+        raise ValueError(f"{name}: expected {num_ad_types} associated data names and counts")
+    try:
+        functions = compile_round_functions(round_functions, block_names, num_blocks, ad_names, ad_counts)
+    except ValueError as e:
+        raise ValueError(f"{name}: {e}")
+
+    # Linear relations among the AD words of each round, one per line or separated by ';'
+    relations = fields.get("ad_relations", [])
+    if isinstance(relations, str):
+        relations = relations.replace(';', '\n').split('\n')
+    relations = [relation.strip() for relation in relations if relation.strip()]
+    # The older yes/no flag stands for ad0 + ad1 = ad2 over three AD types
+    ad_relation = fields.get("ad_relation", False)
+    if isinstance(ad_relation, str):
+        ad_relation = ad_relation.lower() in ('y', 'yes', 'true', '1')
+    if ad_relation and not relations:
+        if num_ad_types != 3:
+            raise ValueError(f"{name}: the AD relation needs exactly three AD types")
+        relations = default_ad_relations(ad_names)
+
+    # Relations name words as the round functions do; store them by the order
+    # in which the round functions take the words, which is how they are numbered
+    order = [[number for function in functions for number in function.ad_numbers[ad_type]] for ad_type in range(len(ad_names))]
+    ad_relations = []
+    for relation in relations:
+        try:
+            words = parse_ad_relation(relation, ad_names, ad_counts)
+            for ad_type, number in words:
+                if number not in order[ad_type]:
+                    raise ValueError(f"{ad_names[ad_type]}{number} is not used by any round function")
+        except ValueError as e:
+            raise ValueError(f"{name}: {e}")
+        ad_relations.append(format_ad_relation(sorted((ad_type, order[ad_type].index(number)) for ad_type, number in words), ad_names))
+
+    return {
+        "name": name,
+        "num_blocks": num_blocks,
+        "block_names": block_names,
+        "ad_counts": ad_counts,
+        "ad_names": ad_names,
+        "round_functions": round_functions,
+        "ad_relations": ad_relations,
+    }
+
+def run_analysis(scheme, max_rounds=None, progress=None, stats=None, backend="propagation", guess_jobs=1, guess_solver="search", time_limit=None):
+    # The result together with the unrolled equations, which are not rendered.
+    # guess_jobs and guess_solver only change how long the guess search takes, not its result.
+    block_names = scheme["block_names"]
+    ad_names = scheme["ad_names"]
+    num_blocks = scheme["num_blocks"]
+    ad_counts = scheme["ad_counts"]
+    num_rounds, equations = unroll_minimum_rounds(block_names, ad_names, num_blocks, ad_counts, scheme["round_functions"], max_rounds, progress, stats)
+
+    result = {"name": scheme["name"], "num_rounds": num_rounds}
+    if backend != "propagation":
+        result["backend"] = backend
+    if scheme["ad_relations"]:
+        unknowns_before_guessing, best_guesses = analyze_guessing(equations, block_names, ad_names, num_blocks, ad_counts, num_rounds, progress, stats, scheme["ad_relations"], guess_jobs, guess_solver, time_limit, backend)
+        result["unknowns_before_guessing"] = unknowns_before_guessing
+        result["guesses"] = best_guesses
+    else:
+        security_level = analyze_security(equations, block_names, ad_names, num_blocks, ad_counts, num_rounds, progress, stats, backend)
+        if isinstance(security_level, int):
+            result["complexity"] = security_level
+        else:
+            result["unresolved"] = sorted(security_level)
+    if stats is not None:
+        result["stats"] = stats.as_dict()
+    return result, equations
+
+def analyze_scheme(scheme, include_equations=False, max_rounds=None, progress=None, stats=None, backend="propagation", guess_jobs=1, guess_solver="search", time_limit=None):
+    result, equations = run_analysis(scheme, max_rounds, progress, stats, backend, guess_jobs, guess_solver, time_limit)
+    if include_equations:
+        with phase(stats, "format_equations"):
+            result["equations"] = format_equations(equations, scheme["block_names"], scheme["num_blocks"])
+        if stats is not None:
+            result["stats"] = stats.as_dict()
+    return result
 
+if __name__ == '__main__':
+    import sys
+    from key_committing_tool_cli import main
+    sys.exit(main())
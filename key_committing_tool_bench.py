@@ -0,0 +1,211 @@
+import argparse
+import contextlib
+import gc
+import importlib.util
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from key_committing_tool import __version__, SCHEME_DEFAULTS, parse_scheme, generate_equations, find_minimum_rounds, analyze_security, analyze_security_with_guessing
+from key_committing_tool_expr import dag_size, text_length
+
+def ring_scheme(num_blocks, num_ads=1):
+    # AEGIS-like ring of num_blocks blocks with num_ads AD words injected at evenly spaced blocks
+    positions = [i * num_blocks // num_ads for i in range(num_ads)]
+    round_functions = []
+    for i in range(num_blocks):
+        func = f"A(S{(i - 1) % num_blocks})+S{i}"
+        if i in positions:
+            func += f"+AD{positions.index(i)}"
+        round_functions.append(func)
+    return {
+        "name": f"ring-{num_blocks}x{num_ads}",
+        "num_blocks": [num_blocks],
+        "block_names": ["S"],
+        "ad_counts": [num_ads],
+        "ad_names": ["AD"],
+        "round_functions": round_functions,
+        "ad_relations": [],
+    }
+
+def build_cases(quick=False):
+    # (scheme, forced round count or None, run the guessing analysis)
+    cases = []
+    for name in SCHEME_DEFAULTS:
+        cases.append((parse_scheme(SCHEME_DEFAULTS[name], name), None, True))
+    for num_blocks in ((4, 8, 12) if quick else (4, 8, 12, 16, 24)):
+        cases.append((ring_scheme(num_blocks), None, False))
+    for num_ads in ((2, 4) if quick else (2, 3, 4, 6)):
+        cases.append((ring_scheme(12, num_ads), None, False))
+    for name, extra_rounds, guessing in (("AEGIS-128L", 4, False), ("Rocca", 4, False), ("Tiaoxin-346", 1, True)):
+        scheme = parse_scheme(SCHEME_DEFAULTS[name], name)
+        num_rounds = find_minimum_rounds(scheme["block_names"], scheme["ad_names"], scheme["num_blocks"], scheme["ad_counts"], scheme["round_functions"])
+        for extra in range(1, (1 if quick else extra_rounds) + 1):
+            cases.append((scheme, num_rounds + extra, guessing and extra <= 1))
+    return cases
+
+def measure(func, repeat, track_memory):
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            value = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    peak = None
+    if track_memory:
+        # A separate run, since tracing slows the timed runs down
+        gc.collect()
+        tracemalloc.start()
+        with contextlib.redirect_stdout(io.StringIO()):
+            func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return value, best, peak
+
+def run_case(scheme, forced_rounds, guessing, repeat=1, track_memory=True):
+    block_names = scheme["block_names"]
+    ad_names = scheme["ad_names"]
+    num_blocks = scheme["num_blocks"]
+    ad_counts = scheme["ad_counts"]
+    round_functions = scheme["round_functions"]
+    label = scheme["name"] if forced_rounds is None else f"{scheme['name']}@{forced_rounds}"
+    records = []
+
+    def record(phase, seconds, peak, **extra):
+        records.append(dict({"case": label, "phase": phase, "seconds": seconds, "peak_bytes": peak}, **extra))
+
+    if forced_rounds is None:
+        num_rounds, seconds, peak = measure(lambda: find_minimum_rounds(block_names, ad_names, num_blocks, ad_counts, round_functions), repeat, track_memory)
+        record("find_minimum_rounds", seconds, peak, num_rounds=num_rounds)
+    else:
+        num_rounds = forced_rounds
+
+    equations, seconds, peak = measure(lambda: generate_equations(round_functions, block_names, ad_names, ad_counts, num_blocks, num_rounds), repeat, track_memory)
+    memo = {}
+    record("generate_equations", seconds, peak, num_rounds=num_rounds, dag_nodes=dag_size(equations), text_length=sum(text_length(eq, memo) for eq in equations))
+
+    security_level, seconds, peak = measure(lambda: analyze_security(equations, block_names, ad_names, num_blocks, ad_counts, num_rounds), repeat, track_memory)
+    record("analyze_security", seconds, peak, result=security_level if isinstance(security_level, int) else len(security_level))
+
+    security_level, seconds, peak = measure(lambda: analyze_security(equations, block_names, ad_names, num_blocks, ad_counts, num_rounds, backend="linear"), repeat, track_memory)
+    record("analyze_security_linear", seconds, peak, result=security_level if isinstance(security_level, int) else len(security_level))
+
+    if guessing:
+        (unknowns, guesses), seconds, peak = measure(lambda: analyze_security_with_guessing(equations, block_names, ad_names, num_blocks, ad_counts, num_rounds), repeat, track_memory)
+        record("analyze_security_with_guessing", seconds, peak, unknowns=len(unknowns), guess_sets=guesses.count('[') if guesses else 0)
+    return records
+
+GUI_STARTUP = """
+from PyQt5 import QtWidgets
+import key_committing_tool_gui
+app = QtWidgets.QApplication([])
+window = key_committing_tool_gui.KeyCommittingTool()
+window.show()
+app.processEvents()
+"""
+
+def startup_cases(has_qt):
+    # (phase, code run in a fresh interpreter); "python" is the interpreter alone
+    cases = [
+        ("python", "pass"),
+        ("import core", "import sys, key_committing_tool\nassert not any(name.startswith('PyQt5') for name in sys.modules)"),
+        ("import cli", "import key_committing_tool_cli"),
+    ]
+    if has_qt:
+        cases.append(("gui window", "import key_committing_tool_gui\nassert key_committing_tool_gui.load_compiled_ui() is not None" + GUI_STARTUP))
+        # Hiding the compiled module makes the window parse the .ui file
+        cases.append(("gui window from .ui", "import sys\nsys.modules['key_committing_tool_ui'] = None" + GUI_STARTUP))
+    return cases
+
+def run_startup(repeat):
+    # Wall time of a fresh interpreter for each phase, including its own startup.
+    # The compiled UI module is generated into a temporary directory, as a build would.
+    source_dir = os.path.dirname(os.path.abspath(__file__))
+    has_qt = importlib.util.find_spec("PyQt5") is not None
+    records = []
+    with tempfile.TemporaryDirectory() as build_dir:
+        if has_qt:
+            from PyQt5 import uic
+            with open(os.path.join(build_dir, "key_committing_tool_ui.py"), "w") as f:
+                uic.compileUi(os.path.join(source_dir, "key_committing_tool.ui"), f)
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join([build_dir, source_dir]))
+        env.setdefault("QT_QPA_PLATFORM", "offscreen")
+        for phase, code in startup_cases(has_qt):
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                process = subprocess.run([sys.executable, "-c", code], cwd=build_dir, env=env, capture_output=True, text=True)
+                elapsed = time.perf_counter() - start
+                if process.returncode != 0:
+                    raise RuntimeError(f"startup phase {phase!r} failed:\n{process.stderr}")
+                best = elapsed if best is None else min(best, elapsed)
+            records.append({"case": "startup", "phase": phase, "seconds": best, "peak_bytes": None})
+    return records
+
+def compare(report, baseline, tolerance, min_seconds):
+    # Slower than the baseline by more than the tolerance, ignoring timer noise on tiny cases
+    previous = {(r["case"], r["phase"]): r for r in baseline["results"]}
+    regressions = []
+    for r in report["results"]:
+        old = previous.get((r["case"], r["phase"]))
+        if old is None:
+            continue
+        if r["seconds"] > old["seconds"] * (1 + tolerance) and r["seconds"] - old["seconds"] > min_seconds:
+            regressions.append(f"{r['case']} {r['phase']}: {old['seconds']:.4f}s -> {r['seconds']:.4f}s")
+        if r.get("peak_bytes") and old.get("peak_bytes") and r["peak_bytes"] > old["peak_bytes"] * (1 + tolerance):
+            regressions.append(f"{r['case']} {r['phase']}: peak {old['peak_bytes']} -> {r['peak_bytes']} bytes")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the analysis on the built-in schemes and synthetic families.")
+    parser.add_argument("-o", "--output", help="write the JSON report here")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown before flagging a regression")
+    parser.add_argument("--min-seconds", type=float, default=0.005, help="ignore slowdowns smaller than this")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per phase (the fastest is kept)")
+    parser.add_argument("--no-memory", action="store_true", help="skip the peak memory runs")
+    parser.add_argument("--quick", action="store_true", help="smaller synthetic families")
+    parser.add_argument("--startup", action="store_true", help="only measure launch times (module imports and opening the GUI window)")
+    args = parser.parse_args(argv)
+
+    results = []
+    for r in run_startup(args.repeat):
+        results.append(r)
+        print(f"{r['case']:<20} {r['phase']:<32} {r['seconds']:9.4f}s", file=sys.stderr)
+    if not args.startup:
+        for scheme, forced_rounds, guessing in build_cases(args.quick):
+            for r in run_case(scheme, forced_rounds, guessing, args.repeat, not args.no_memory):
+                results.append(r)
+                print(f"{r['case']:<20} {r['phase']:<32} {r['seconds']:9.4f}s", file=sys.stderr)
+
+    report = {
+        "version": __version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+        print()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance, args.min_seconds)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+import zlib
+from key_committing_tool import __version__, generate_equations, run_analysis
+
+DEFAULT_CACHE_SIZE = 64 * 1024 * 1024
+
+def default_cache_path():
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "key_committing_tool", "results.sqlite")
+
+def scheme_key(scheme, backend="propagation"):
+    # The scheme name and whitespace in the round functions do not change the result
+    canonical = {
+        "block_names": scheme["block_names"],
+        "num_blocks": scheme["num_blocks"],
+        "ad_names": scheme["ad_names"],
+        "ad_counts": scheme["ad_counts"],
+        "round_functions": [re.sub(r'\s+', '', func) for func in scheme["round_functions"]],
+        "ad_relations": scheme["ad_relations"],
+    }
+    # Left out for the default backend so that existing entries stay valid
+    if backend != "propagation":
+        canonical["backend"] = backend
+    text = json.dumps(canonical, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(text.encode()).hexdigest()
+
+class ResultCache:
+    # Content-addressed store of analyze_scheme results with LRU eviction.
+    # The cache is best effort: database errors are treated as misses.
+    def __init__(self, path=None, max_bytes=DEFAULT_CACHE_SIZE):
+        self.path = path or default_cache_path()
+        self.max_bytes = max_bytes
+        self.ready = False
+
+    def connect(self):
+        if not self.ready:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        if not self.ready:
+            with conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+                conn.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, data BLOB, size INTEGER, last_used REAL)")
+                row = conn.execute("SELECT value FROM meta WHERE name = 'version'").fetchone()
+                # Results of another tool version may differ, so drop them all
+                if row is None or row[0] != __version__:
+                    conn.execute("DELETE FROM results")
+                    conn.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (__version__,))
+            self.ready = True
+        return conn
+
+    def get(self, scheme, include_equations=False, backend="propagation"):
+        key = scheme_key(scheme, backend)
+        try:
+            conn = self.connect()
+            try:
+                with conn:
+                    row = conn.execute("SELECT data FROM results WHERE key = ?", (key,)).fetchone()
+                    if row is None:
+                        return None
+                    result = json.loads(zlib.decompress(row[0]))
+                    if include_equations and "equations" not in result:
+                        return None
+                    conn.execute("UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key))
+            finally:
+                conn.close()
+        except (OSError, sqlite3.Error):
+            return None
+        if not include_equations:
+            result.pop("equations", None)
+        result["name"] = scheme["name"]
+        return result
+
+    def put(self, scheme, result, backend="propagation"):
+        key = scheme_key(scheme, backend)
+        result = {name: value for name, value in result.items() if name != "stats"}
+        data = zlib.compress(json.dumps(result, separators=(',', ':')).encode())
+        if len(data) > self.max_bytes:
+            return
+        try:
+            conn = self.connect()
+            try:
+                with conn:
+                    # Keep an entry that already has the equations when this result lacks them
+                    row = conn.execute("SELECT data FROM results WHERE key = ?", (key,)).fetchone()
+                    if row is not None and "equations" not in result and "equations" in json.loads(zlib.decompress(row[0])):
+                        return
+                    conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)", (key, data, len(data), time.time()))
+                    self.evict(conn)
+            finally:
+                conn.close()
+        except (OSError, sqlite3.Error):
+            pass
+
+    def evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in conn.execute("SELECT key, size FROM results ORDER BY last_used").fetchall():
+            conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def clear(self):
+        try:
+            conn = self.connect()
+            try:
+                with conn:
+                    conn.execute("DELETE FROM results")
+            finally:
+                conn.close()
+        except (OSError, sqlite3.Error):
+            pass
+
+def cached_analysis(scheme, cache, max_rounds=None, progress=None, stats=None, backend="propagation"):
+    # Returns the result and the unrolled equations. On a hit the equations are
+    # unrolled again for the cached round count, which is cheap next to the
+    # analysis; a cached result has no stats, since nothing was run.
+    result = cache.get(scheme, backend=backend) if cache is not None else None
+    if result is None:
+        result, equations = run_analysis(scheme, max_rounds, progress, stats, backend)
+        if cache is not None:
+            cache.put(scheme, result, backend)
+        return result, equations
+    equations = generate_equations(scheme["round_functions"], scheme["block_names"], scheme["ad_names"], scheme["ad_counts"], scheme["num_blocks"], result["num_rounds"])
+    return result, equations
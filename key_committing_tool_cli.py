@@ -0,0 +1,173 @@
+import argparse
+import cProfile
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from key_committing_tool import SCHEME_DEFAULTS, BACKENDS, GUESS_SOLVERS, AnalysisStats, parse_scheme, analyze_scheme, run_analysis, format_equations, iter_equations, write_equations
+from key_committing_tool_cache import ResultCache
+
+def load_scheme_file(path):
+    with open(path) as f:
+        text = f.read()
+    if os.path.splitext(path)[1].lower() in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError(f"{path}: reading YAML needs PyYAML (pip install pyyaml)")
+        try:
+            data = yaml.safe_load(text)
+        except yaml.YAMLError as e:
+            raise ValueError(f"{path}: {e}")
+    else:
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"{path}: {e}")
+
+    # A single scheme, a list of schemes, or a mapping of names to schemes like SCHEME_DEFAULTS
+    base_name = os.path.splitext(os.path.basename(path))[0]
+    if isinstance(data, dict) and "round_functions" in data:
+        entries = [(data.get("name", base_name), data)]
+    elif isinstance(data, list):
+        entries = [(fields.get("name", f"{base_name}[{i}]") if isinstance(fields, dict) else f"{base_name}[{i}]", fields) for i, fields in enumerate(data)]
+    elif isinstance(data, dict):
+        entries = list(data.items())
+    else:
+        raise ValueError(f"{path}: expected a scheme, a list of schemes or a mapping of schemes")
+    for name, fields in entries:
+        if not isinstance(fields, dict):
+            raise ValueError(f"{path}: scheme {name} is not a mapping of fields")
+    if not entries:
+        raise ValueError(f"{path}: no schemes")
+    return [parse_scheme(fields, name) for name, fields in entries]
+
+def equations_path(directory, scheme):
+    return os.path.join(directory, re.sub(r'[^A-Za-z0-9_.-]+', '_', scheme["name"]) + ".txt")
+
+def save_equations(scheme, equations, directory):
+    # Written one equation at a time, so the full text is never held in memory
+    with open(equations_path(directory, scheme), "w") as f:
+        write_equations(equations, scheme["block_names"], scheme["num_blocks"], f)
+
+def run_scheme(scheme, include_equations, max_rounds, collect_stats=False, equations_dir=None, backend="propagation", guess_jobs=1, guess_solver="search", time_limit=None):
+    try:
+        stats = AnalysisStats() if collect_stats else None
+        if equations_dir is None:
+            return analyze_scheme(scheme, include_equations, max_rounds, stats=stats, backend=backend, guess_jobs=guess_jobs, guess_solver=guess_solver, time_limit=time_limit)
+        result, equations = run_analysis(scheme, max_rounds, stats=stats, backend=backend, guess_jobs=guess_jobs, guess_solver=guess_solver, time_limit=time_limit)
+        save_equations(scheme, equations, equations_dir)
+        if include_equations:
+            result["equations"] = format_equations(equations, scheme["block_names"], scheme["num_blocks"])
+        return result
+    except Exception as e:
+        return {"name": scheme["name"], "error": str(e)}
+
+def iter_results(schemes, jobs, include_equations=False, max_rounds=None, collect_stats=False, equations_dir=None, backend="propagation", guess_jobs=1, guess_solver="search", time_limit=None):
+    # (scheme, result) pairs are yielded as each scheme finishes, not in input order
+    if jobs == 1 or len(schemes) <= 1:
+        for scheme in schemes:
+            yield scheme, run_scheme(scheme, include_equations, max_rounds, collect_stats, equations_dir, backend, guess_jobs, guess_solver, time_limit)
+        return
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(run_scheme, scheme, include_equations, max_rounds, collect_stats, equations_dir, backend, guess_jobs, guess_solver, time_limit): scheme for scheme in schemes}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m key_committing_tool", description="Key committing attack analysis without the GUI.")
+    parser.add_argument("files", nargs="*", help="JSON or YAML scheme definitions")
+    parser.add_argument("-p", "--preset", action="append", default=[], choices=sorted(SCHEME_DEFAULTS), help="analyze a built-in scheme (repeatable)")
+    parser.add_argument("--all-presets", action="store_true", help="analyze every built-in scheme")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="number of worker processes (0 = one per CPU)")
+    parser.add_argument("--guess-jobs", type=int, default=1, metavar="N", help="worker processes for the guess search of each scheme with an AD relation (0 = one per CPU)")
+    parser.add_argument("-o", "--output", help="write JSON lines here instead of stdout")
+    parser.add_argument("--equations", action="store_true", help="include the unrolled equations in the results")
+    parser.add_argument("--equations-dir", metavar="DIR", help="stream the unrolled equations of each scheme to DIR/<name>.txt")
+    parser.add_argument("--backend", choices=BACKENDS, default="propagation", help="how unknowns are resolved, also after each guess for schemes with an AD relation; linear also combines equations by Gaussian elimination")
+    parser.add_argument("--guess-solver", choices=GUESS_SOLVERS, default="search", help="find the minimum guesses with the built-in search, PySAT or OR-Tools")
+    parser.add_argument("--time-limit", type=float, metavar="SECONDS", help="give up on the guesses of a scheme when the pysat or ortools solver takes longer than this")
+    parser.add_argument("--max-rounds", type=int, default=100, help="give up on schemes that need more rounds than this")
+    parser.add_argument("--cache", metavar="PATH", help="result cache database (default: ~/.cache/key_committing_tool/results.sqlite)")
+    parser.add_argument("--cache-size", type=int, default=64, metavar="MB", help="evict least recently used results above this size")
+    parser.add_argument("--no-cache", action="store_true", help="always run the analysis and do not store results")
+    parser.add_argument("--stats", action="store_true", help="add per-phase timers and counters to each result (bypasses the cache)")
+    parser.add_argument("--profile", metavar="FILE", help="run a single scheme under cProfile and write the pstats data here")
+    parser.add_argument("--trace", metavar="FILE", help="run a single scheme and write its phases as a Chrome trace here")
+    return parser
+
+def guess_jobs(args):
+    return args.guess_jobs if args.guess_jobs > 0 else os.cpu_count() or 1
+
+def profile_scheme(scheme, args):
+    stats = AnalysisStats(trace=bool(args.trace))
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        result = analyze_scheme(scheme, args.equations, args.max_rounds, stats=stats, backend=args.backend, guess_jobs=guess_jobs(args), guess_solver=args.guess_solver, time_limit=args.time_limit)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+    if args.trace:
+        stats.write_trace(args.trace)
+    print(json.dumps(result))
+    return 0
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    schemes = []
+    presets = sorted(SCHEME_DEFAULTS) if args.all_presets else args.preset
+    try:
+        for name in presets:
+            schemes.append(parse_scheme(SCHEME_DEFAULTS[name], name))
+        for path in args.files:
+            schemes.extend(load_scheme_file(path))
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    if not schemes:
+        parser.error("no schemes given (pass files, --preset or --all-presets)")
+
+    if args.profile or args.trace:
+        if len(schemes) != 1:
+            parser.error("--profile and --trace need exactly one scheme")
+        return profile_scheme(schemes[0], args)
+
+    jobs = args.jobs if args.jobs > 0 else os.cpu_count() or 1
+    if args.equations_dir:
+        try:
+            os.makedirs(args.equations_dir, exist_ok=True)
+        except OSError as e:
+            parser.error(str(e))
+    out = open(args.output, "w") if args.output else sys.stdout
+    cache = None if args.no_cache or args.stats else ResultCache(args.cache, args.cache_size * 1024 * 1024)
+    failed = False
+    try:
+        # Cached results are written right away; only the misses are analyzed
+        pending = []
+        for scheme in schemes:
+            result = cache.get(scheme, args.equations, args.backend) if cache is not None else None
+            if result is None:
+                pending.append(scheme)
+            else:
+                if args.equations_dir:
+                    save_equations(scheme, iter_equations(scheme["round_functions"], scheme["block_names"], scheme["ad_names"], scheme["ad_counts"], scheme["num_blocks"], result["num_rounds"]), args.equations_dir)
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+        for scheme, result in iter_results(pending, jobs, args.equations, args.max_rounds, args.stats, args.equations_dir, args.backend, guess_jobs(args), args.guess_solver, args.time_limit):
+            failed = failed or "error" in result
+            if cache is not None and "error" not in result:
+                cache.put(scheme, result, args.backend)
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
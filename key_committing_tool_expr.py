@@ -0,0 +1,384 @@
+import re
+import threading
+import weakref
+
+VAR = 'var'
+APPLY = 'A'
+SUM = 'sum'
+
+# Every expression is hash-consed: building the same node twice returns the
+# same object, so unrolled rounds share the subterms of previous rounds.
+_nodes = weakref.WeakValueDictionary()
+
+_TOKEN_RE = re.compile(r'\s*(?:(A)\s*\(|([A-Za-z_][A-Za-z0-9_]*)|(\+)|(\()|(\)))')
+
+class Variable:
+    __slots__ = ('name', 'id')
+
+    def __init__(self, name, id):
+        self.name = name
+        self.id = id
+
+    def __repr__(self):
+        return f"Variable({self.name!r}, {self.id})"
+
+# Symbol table: every variable name gets a dense integer ID the first time it
+# is seen. Sets of variables are bitmasks over these IDs, and names are only
+# looked up again when a result is reported.
+_variables_by_name = {}
+_variables_by_id = []
+_symbol_lock = threading.Lock()
+
+def intern_variable(name):
+    variable = _variables_by_name.get(name)
+    if variable is None:
+        with _symbol_lock:
+            variable = _variables_by_name.get(name)
+            if variable is None:
+                variable = Variable(name, len(_variables_by_id))
+                _variables_by_id.append(variable)
+                _variables_by_name[name] = variable
+    return variable
+
+def variable_mask(names):
+    mask = 0
+    for name in names:
+        mask |= 1 << intern_variable(name).id
+    return mask
+
+def variable_names(mask):
+    names = []
+    while mask:
+        low = mask & -mask
+        names.append(_variables_by_id[low.bit_length() - 1].name)
+        mask ^= low
+    return names
+
+class Expr:
+    __slots__ = ('kind', 'name', 'args', 'id', 'variable_mask', '__weakref__')
+
+    def __init__(self, kind, name, args):
+        self.kind = kind
+        self.name = name
+        self.args = args
+        # variable_mask holds the IDs of all variables in the expression
+        if kind == VAR:
+            # Symbol table ID, read in the hot simplification loops
+            self.id = intern_variable(name).id
+            self.variable_mask = 1 << self.id
+        else:
+            self.id = None
+            # Arguments are always built first, so this never walks more than one level of the DAG
+            mask = 0
+            for arg in args:
+                mask |= arg.variable_mask
+            self.variable_mask = mask
+
+    @property
+    def variables(self):
+        return frozenset(variable_names(self.variable_mask))
+
+    @property
+    def terms(self):
+        # Top-level summands; A(...) terms and variables are atoms
+        if self.kind == SUM:
+            return self.args
+        return (self,)
+
+    def __bool__(self):
+        return self is not ZERO
+
+    def __reduce__(self):
+        # As a flat table, since pickling the nested nodes would recurse once per level
+        table, roots = pack_expressions([self])
+        return (_unpack_expression, (table, roots[0]))
+
+    def __str__(self):
+        return ''.join(iter_text(self))
+
+    def __repr__(self):
+        return f"Expr({str(self)!r})"
+
+def _intern(kind, name, args):
+    key = (kind, name, args)
+    node = _nodes.get(key)
+    if node is None:
+        node = Expr(kind, name, args)
+        _nodes[key] = node
+    return node
+
+def var(name):
+    return _intern(VAR, name, ())
+
+def apply_a(arg):
+    return _intern(APPLY, None, (arg,))
+
+def add(*operands):
+    terms = []
+    for operand in operands:
+        terms.extend(operand.terms if operand.kind == SUM else (operand,))
+    if len(terms) == 1:
+        return terms[0]
+    return _intern(SUM, None, tuple(terms))
+
+ZERO = _intern(SUM, None, ())
+
+def iter_text(node):
+    # The printed form in small chunks, without recursion or building the whole string
+    stack = [node]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            yield item
+        elif item.kind == VAR:
+            yield item.name
+        elif item.kind == APPLY:
+            yield 'A('
+            stack.append(')')
+            stack.append(item.args[0])
+        else:
+            for i in range(len(item.args) - 1, -1, -1):
+                stack.append(item.args[i])
+                if i:
+                    stack.append('+')
+
+def write_expression(node, out, buffer_size=1 << 16):
+    buffer = []
+    buffered = 0
+    for chunk in iter_text(node):
+        buffer.append(chunk)
+        buffered += len(chunk)
+        if buffered >= buffer_size:
+            out.write(''.join(buffer))
+            buffer = []
+            buffered = 0
+    out.write(''.join(buffer))
+
+def truncated_text(node, max_chars):
+    # At most max_chars characters of the printed form, and whether it was cut
+    parts = []
+    length = 0
+    for chunk in iter_text(node):
+        if length + len(chunk) > max_chars:
+            parts.append(chunk[:max_chars - length])
+            return ''.join(parts), True
+        parts.append(chunk)
+        length += len(chunk)
+    return ''.join(parts), False
+
+def tokenize(text):
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = _TOKEN_RE.match(text, pos)
+        if match is None or match.end() == pos:
+            raise ValueError(f"Unexpected character {text[pos:].lstrip()[:1]!r} in expression: {text}")
+        apply_token, ident, plus, lparen, rparen = match.groups()
+        if apply_token:
+            tokens.append('A(')
+        elif ident:
+            tokens.append(ident)
+        elif plus:
+            tokens.append('+')
+        elif lparen:
+            tokens.append('(')
+        else:
+            tokens.append(')')
+        pos = match.end()
+    return tokens
+
+def parse_expression(text, lookup=None):
+    # lookup maps an identifier to the node it stands for (defaults to a variable)
+    tokens = tokenize(text)
+    if not tokens:
+        raise ValueError("Empty expression")
+    pos = 0
+
+    def parse_sum():
+        nonlocal pos
+        operands = [parse_term()]
+        while pos < len(tokens) and tokens[pos] == '+':
+            pos += 1
+            operands.append(parse_term())
+        return add(*operands)
+
+    def parse_term():
+        nonlocal pos
+        if pos >= len(tokens):
+            raise ValueError(f"Unexpected end of expression: {text}")
+        token = tokens[pos]
+        pos += 1
+        if token in ('A(', '('):
+            inner = parse_sum()
+            if pos >= len(tokens) or tokens[pos] != ')':
+                raise ValueError(f"Missing ')' in expression: {text}")
+            pos += 1
+            return apply_a(inner) if token == 'A(' else inner
+        if token in ('+', ')'):
+            raise ValueError(f"Unexpected {token!r} in expression: {text}")
+        if lookup is not None:
+            return lookup(token)
+        return var(token)
+
+    node = parse_sum()
+    if pos != len(tokens):
+        raise ValueError(f"Unexpected {tokens[pos]!r} in expression: {text}")
+    return node
+
+def as_expression(expression):
+    if isinstance(expression, Expr):
+        return expression
+    if '=' in expression:
+        expression = expression.split('=')[1]
+    return parse_expression(expression.strip())
+
+def _fold(node, memo, children, combine):
+    # Bottom-up over the DAG with an explicit stack, so that deep unrollings do
+    # not hit the recursion limit: combine(n) runs once every node of children(n)
+    # has its value in memo
+    stack = [node]
+    while stack:
+        current = stack[-1]
+        if current in memo:
+            stack.pop()
+            continue
+        pending = [child for child in children(current) if child not in memo]
+        if pending:
+            stack.extend(pending)
+        else:
+            stack.pop()
+            memo[current] = combine(current)
+    return memo[node]
+
+def _arguments(node):
+    return node.args
+
+def pack_expressions(nodes):
+    # The DAG below nodes as a flat table of (kind, name, argument positions)
+    # in which every node comes after its arguments, and the positions of nodes
+    positions = {}
+    table = []
+
+    def combine(current):
+        table.append((current.kind, current.name, tuple(positions[arg] for arg in current.args)))
+        return len(table) - 1
+
+    roots = [_fold(node, positions, _arguments, combine) for node in nodes]
+    return table, roots
+
+def unpack_expressions(table, roots):
+    built = []
+    for kind, name, args in table:
+        built.append(_intern(kind, name, tuple(built[i] for i in args)))
+    return [built[i] for i in roots]
+
+def _unpack_expression(table, root):
+    return unpack_expressions(table, [root])[0]
+
+def substitute(node, mapping, memo=None):
+    # Replace variables by nodes, reusing the result for shared subterms
+    if memo is None:
+        memo = {}
+
+    def combine(current):
+        if current.kind == VAR:
+            return mapping.get(current.name, current)
+        if current.kind == APPLY:
+            return apply_a(memo[current.args[0]])
+        return add(*(memo[term] for term in current.args))
+
+    return _fold(node, memo, _arguments, combine)
+
+def iter_subterms(node):
+    # Each distinct node of the DAG once, the root first
+    seen = {node}
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        yield current
+        for arg in current.args:
+            if arg not in seen:
+                seen.add(arg)
+                stack.append(arg)
+
+def _find_run(terms, pattern, start=0):
+    width = len(pattern)
+    for i in range(start, len(terms) - width + 1):
+        if terms[i:i + width] == pattern:
+            return i
+    return -1
+
+def contains(node, pattern):
+    if pattern is ZERO:
+        return True
+    pattern_terms = pattern.terms
+    for sub in iter_subterms(node):
+        if sub is pattern:
+            return True
+        if sub.kind == SUM and len(pattern_terms) > 1 and _find_run(sub.args, pattern_terms) >= 0:
+            return True
+    return False
+
+def remove_subexpression(node, pattern, memo=None):
+    # Drop every occurrence of pattern (as a whole node or a run of summands)
+    if pattern is ZERO:
+        return node
+    if memo is None:
+        memo = {}
+    pattern_terms = pattern.terms
+    width = len(pattern_terms)
+
+    def kept_terms(current):
+        kept = []
+        i = 0
+        while i < len(current.args):
+            if current.args[i:i + width] == pattern_terms:
+                i += width
+                continue
+            kept.append(current.args[i])
+            i += 1
+        return kept
+
+    def children(current):
+        if current is pattern or current.kind == VAR:
+            return ()
+        if current.kind == APPLY:
+            return current.args
+        return kept_terms(current)
+
+    def combine(current):
+        if current is pattern:
+            return ZERO
+        if current.kind == VAR:
+            return current
+        if current.kind == APPLY:
+            return apply_a(memo[current.args[0]])
+        return add(*(memo[term] for term in kept_terms(current)))
+
+    return _fold(node, memo, children, combine)
+
+def dag_size(nodes):
+    # Number of distinct nodes reachable from the given expressions
+    seen = set()
+    stack = list(nodes)
+    while stack:
+        node = stack.pop()
+        if node not in seen:
+            seen.add(node)
+            stack.extend(node.args)
+    return len(seen)
+
+def text_length(node, memo=None):
+    # len(str(node)) without rendering the string
+    if memo is None:
+        memo = {}
+
+    def combine(current):
+        if current.kind == VAR:
+            return len(current.name)
+        if current.kind == APPLY:
+            return memo[current.args[0]] + 3
+        return sum(memo[term] for term in current.args) + max(len(current.args) - 1, 0)
+
+    return _fold(node, memo, _arguments, combine)
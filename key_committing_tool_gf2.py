@@ -0,0 +1,92 @@
+_numpy = None  # the module once imported, False when it is not installed
+
+def load_numpy():
+    # Imported on first use: it takes longer to import than most analyses take to run
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            numpy = False
+        _numpy = numpy
+    return _numpy or None
+
+# Below this many matrix cells the plain integer elimination is faster than NumPy
+NUMPY_MIN_CELLS = 1 << 16
+
+class GF2Basis:
+    # Row space of bit vectors over GF(2), kept in reduced row echelon form.
+    # Rows are ints; the pivot of a row is its highest set bit.
+    def __init__(self):
+        self.rows = {}  # pivot bit -> row
+        self.pivots = 0
+
+    @classmethod
+    def from_rows(cls, rows, width, use_numpy=None):
+        # One batched elimination; use_numpy=None picks NumPy for large matrices when it is installed
+        rows = [row for row in rows if row]
+        if use_numpy is None:
+            use_numpy = len(rows) * width >= NUMPY_MIN_CELLS and load_numpy() is not None
+        if use_numpy:
+            rows = eliminate_numpy(rows, width)
+        basis = cls()
+        for row in rows:
+            basis.add(row)
+        return basis
+
+    def reduce(self, row):
+        # Pivot columns are zero in every other row, so one pass over them is enough
+        pivots = row & self.pivots
+        while pivots:
+            bit = pivots.bit_length() - 1
+            row ^= self.rows[bit]
+            pivots &= ~(1 << bit)
+        return row
+
+    def add(self, row):
+        row = self.reduce(row)
+        if not row:
+            return False
+        bit = row.bit_length() - 1
+        for pivot, other in self.rows.items():
+            if other >> bit & 1:
+                self.rows[pivot] = other ^ row
+        self.rows[bit] = row
+        self.pivots |= 1 << bit
+        return True
+
+    def contains(self, row):
+        return self.reduce(row) == 0
+
+    def units(self):
+        # Columns whose unit vector is in the span, i.e. the determined unknowns
+        mask = 0
+        for pivot, row in self.rows.items():
+            if row == 1 << pivot:
+                mask |= row
+        return mask
+
+def eliminate_numpy(rows, width):
+    # Reduced row echelon form of the rows with bit-packed NumPy arrays,
+    # taking pivots from the highest column down like GF2Basis.add
+    numpy = load_numpy()
+    num_bytes = (width + 7) // 8
+    matrix = numpy.array([numpy.frombuffer(row.to_bytes(num_bytes, 'little'), dtype=numpy.uint8) for row in rows], dtype=numpy.uint8)
+    num_pivots = 0
+    for column in range(width - 1, -1, -1):
+        byte, bit = divmod(column, 8)
+        has_bit = (matrix[:, byte] >> bit) & 1
+        candidates = numpy.flatnonzero(has_bit[num_pivots:])
+        if not len(candidates):
+            continue
+        pivot = num_pivots + candidates[0]
+        if pivot != num_pivots:
+            matrix[[num_pivots, pivot]] = matrix[[pivot, num_pivots]]
+            has_bit[[num_pivots, pivot]] = has_bit[[pivot, num_pivots]]
+        # Clear the column in every other row with a single XOR
+        has_bit[num_pivots] = 0
+        matrix[has_bit.astype(bool)] ^= matrix[num_pivots]
+        num_pivots += 1
+        if num_pivots == len(rows):
+            break
+    return [int.from_bytes(matrix[i].tobytes(), 'little') for i in range(num_pivots)]
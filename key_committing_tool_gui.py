@@ -1,77 +1,61 @@
 import sys
 import os
-from PyQt5 import QtWidgets, uic
-from PyQt5.QtWidgets import QMessageBox, QInputDialog
-from key_committing_tool import find_minimum_rounds, generate_equations, analyze_security, analyze_security_with_guessing
+import time
+from PyQt5 import QtCore, QtWidgets
+from PyQt5.QtWidgets import QMessageBox, QFileDialog
+from key_committing_tool import SCHEME_DEFAULTS, AnalysisCancelled, AnalysisStats, parse_scheme, format_guesses, format_stats, preview_equations, write_equations
+
+# The equation pane shows about this many characters; Save writes everything
+EQUATION_PREVIEW_CHARS = 200000
+
+UI_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'key_committing_tool.ui')
+
+def load_compiled_ui(ui_path=UI_PATH):
+    # key_committing_tool_ui is generated from the .ui file at build time with
+    # pyuic5. In a source checkout it is ignored once the .ui file is newer.
+    try:
+        import key_committing_tool_ui
+    except ImportError:
+        return None
+    try:
+        if os.path.getmtime(key_committing_tool_ui.__file__) < os.path.getmtime(ui_path):
+            return None
+    except (OSError, TypeError):
+        pass  # e.g. inside a bundle, where the module has no file of its own
+    return key_committing_tool_ui
+
+def setup_ui(window, ui_path=UI_PATH):
+    compiled = load_compiled_ui(ui_path)
+    if compiled is None:
+        # Parsing the XML needs uic, which is slow to import, so only here
+        from PyQt5 import uic
+        uic.loadUi(ui_path, window)
+        return
+    ui = compiled.Ui_KeyCommittingTool()
+    ui.setupUi(window)
+    # Widgets become attributes of the window, as with uic.loadUi
+    for name, widget in vars(ui).items():
+        setattr(window, name, widget)
 
 class KeyCommittingTool(QtWidgets.QMainWindow):
     def __init__(self):
         super(KeyCommittingTool, self).__init__()
         
-        # Adjust the path to the UI file
-        ui_path = os.path.join(os.path.dirname(__file__), 'key_committing_tool.ui')
-        uic.loadUi(ui_path, self)
-
-        self.scheme_defaults = {
-            "AEGIS-128": {
-                "num_block_types": "1",
-                "num_blocks": "5",
-                "block_names": "S",
-                "num_ad_types": "1",
-                "ad_counts": "1",
-                "ad_names": "AD",
-                "round_functions": "A(S4)+S0+AD0\nA(S0)+S1\nA(S1)+S2\nA(S2)+S3\nA(S3)+S4"
-            },
-            "AEGIS-128L": {
-                "num_block_types": "1",
-                "num_blocks": "8",
-                "block_names": "S",
-                "num_ad_types": "1",
-                "ad_counts": "2",
-                "ad_names": "AD",
-                "round_functions": "A(S7)+S0+AD0\nA(S0)+S1\nA(S1)+S2\nA(S2)+S3\nA(S3)+S4+AD1\nA(S4)+S5\nA(S5)+S6\nA(S6)+S7"
-            },
-            "AEGIS-256": {
-                "num_block_types": "1",
-                "num_blocks": "6",
-                "block_names": "S",
-                "num_ad_types": "1",
-                "ad_counts": "1",
-                "ad_names": "AD",
-                "round_functions": "A(S4)+S0+AD0\nA(S0)+S1\nA(S1)+S2\nA(S2)+S3\nA(S3)+S4\nA(S4)+S5"
-            },
-            "Rocca": {
-                "num_block_types": "1",
-                "num_blocks": "8",
-                "block_names": "S",
-                "num_ad_types": "1",
-                "ad_counts": "2",
-                "ad_names": "AD",
-                "round_functions": "S7+AD0\nA(S0)+S7\nS1+S6\nA(S2)+S1\nS3+AD1\nA(S4)+S3\nA(S5)+S4\nS0+S6"
-            },
-            "Rocca-S": {
-                "num_block_types": "1",
-                "num_blocks": "7",
-                "block_names": "S",
-                "num_ad_types": "1",
-                "ad_counts": "2",
-                "ad_names": "AD",
-                "round_functions": "S1+S6\nA(S0)+AD0\nA(S1)+S0\nA(S2)+S6\nA(S3)+AD1\nA(S4)+S3\nA(S5)+S4"
-            },
-            "Tiaoxin-346": {
-                "num_block_types": "3",
-                "num_blocks": "3 4 6",
-                "block_names": "U V W",
-                "num_ad_types": "3",
-                "ad_counts": "1 1 1",
-                "ad_names": "a b c",
-                "round_functions": "U0+a0+A(U2)\nA(U0)\nU1\nV0+b0+A(V3)\nA(V0)\nV1\nV2\nW0+c0+A(W5)\nA(W0)\nW1\nW2\nW3\nW4"
-            }
-        }
+        setup_ui(self)
+
+        self.scheme_defaults = SCHEME_DEFAULTS
         
         self.cipher_type_combo.currentTextChanged.connect(self.populate_scheme_fields)
         self.analyze_button.clicked.connect(self.analyze)
         self.exit_button.clicked.connect(self.close)
+        self.cancel_button.clicked.connect(self.cancel_analysis)
+        self.cancel_button.setEnabled(False)
+        self.save_button.clicked.connect(self.save_equations)
+        self.save_button.setEnabled(False)
+        self.saved_equations = None
+        self.worker = None
+        self.progress_info = {}
+        self.result_cache = None  # opened with the first analysis
 
     def populate_scheme_fields(self):
         selected_scheme = self.cipher_type_combo.currentText()
@@ -84,85 +68,151 @@ class KeyCommittingTool(QtWidgets.QMainWindow):
             self.input_text_edit_5.setText(scheme_data["ad_counts"])
             self.input_text_edit_6.setText(scheme_data["ad_names"])
             self.input_text_edit_7.setPlainText(scheme_data["round_functions"])
+            self.input_text_edit_8.setPlainText(scheme_data.get("ad_relations", ""))
 
     def analyze(self):
         # Get the cipher type and input text
         cipher_type = self.cipher_type_combo.currentText()
 
         try:
-            num_block_types = int(self.input_text_edit.toPlainText().strip())
-            num_blocks = list(map(int, self.input_text_edit_2.toPlainText().strip().split()))
-            block_names = self.input_text_edit_3.toPlainText().strip().split()
-            num_ad_types = int(self.input_text_edit_4.toPlainText().strip())
-            ad_counts = list(map(int, self.input_text_edit_5.toPlainText().strip().split()))
-            ad_names = self.input_text_edit_6.toPlainText().strip().split()
-            round_functions = self.input_text_edit_7.toPlainText().strip().split('\n')
-            inputs = num_block_types, num_blocks, block_names, num_ad_types, ad_counts, ad_names, round_functions
-            if inputs is not None:
-                if cipher_type == 'Custom':
-                    if num_ad_types == 3:
-                        response, ok = QInputDialog.getText(self, "Input", f"Do the associated data have the following relationship: {ad_names[0]} + {ad_names[1]} = {ad_names[2]}? (Y/N):")
-                        if ok and response.lower() == 'y':
-                            cipher_type = 'Tiaoxin-346'
-                
-                if cipher_type == 'Tiaoxin-346':
-                    if num_ad_types != 3:
-                        QMessageBox.warning(self, "Error", "Try Custom!")
-                        return
-                    num_rounds = find_minimum_rounds(block_names, ad_names, num_blocks, ad_counts, round_functions)
-                    equations = generate_equations(round_functions, block_names, ad_names, ad_counts, num_blocks, num_rounds)
-                    unknowns_before_guessing, guesses = analyze_security_with_guessing(equations, block_names, ad_names, num_blocks, ad_counts, num_rounds)
-                    result = f"Attack rounds: {num_rounds}\nUnknown values before guessing: {unknowns_before_guessing}\nGuesses needed to resolve all unknowns: {guesses}"
-                elif cipher_type == 'AEGIS-128' or 'AEGIS-128L' or 'AEGIS-256':
-                    if num_ad_types not in [1, 2]:
-                        QMessageBox.warning(self, "Error", "Try Custom!")
-                        return
-                    num_rounds = find_minimum_rounds(block_names, ad_names, num_blocks, ad_counts, round_functions)
-                    equations = generate_equations(round_functions, block_names, ad_names, ad_counts, num_blocks, num_rounds)
-                    security_level = analyze_security(equations, block_names, ad_names, num_blocks, ad_counts, num_rounds)
-                    if not isinstance(security_level, int):
-                        QMessageBox.warning(self, "Error", "Analysis cannot be performed.")
-                        return
-                    result = f"Attack rounds: {num_rounds}\nComplexity: 2^{security_level}"
-                elif cipher_type == 'Rocca' or 'Rocca-S':
-                    if num_ad_types != 2:
-                        QMessageBox.warning(self, "Error", "Try Custom!")
-                        return
-                    num_rounds = find_minimum_rounds(block_names, ad_names, num_blocks, ad_counts, round_functions)
-                    equations = generate_equations(round_functions, block_names, ad_names, ad_counts, num_blocks, num_rounds)
-                    security_level = analyze_security(equations, block_names, ad_names, num_blocks, ad_counts, num_rounds)
-                    if not isinstance(security_level, int):
-                        QMessageBox.warning(self, "Error", "Analysis cannot be performed.")
-                        return
-                    result = f"Attack rounds: {num_rounds}\nComplexity: 2^{security_level}"
-                else:
-                    num_rounds = find_minimum_rounds(block_names, ad_names, num_blocks, ad_counts, round_functions)
-                    equations = generate_equations(round_functions, block_names, ad_names, ad_counts, num_blocks, num_rounds)
-                    security_level = analyze_security(equations, block_names, ad_names, num_blocks, ad_counts, num_rounds)
-                    if not isinstance(security_level, int):
-                        QMessageBox.warning(self, "Error", "Analysis cannot be performed.")
-                        return
-                    result = f"Attack rounds: {num_rounds}\nComplexity: 2^{security_level}"
-                
-                # Generate the equations with T_{index} = format
-                formatted_equations = []
-                for block_type_index, block_name in enumerate(block_names):
-                    for block_index in range(num_blocks[block_type_index]):
-                        if num_block_types == 1:
-                            formatted_equations.append(f"T_{block_index} = {equations[sum(num_blocks[:block_type_index]) + block_index]}")
-                        else:
-                            formatted_equations.append(f"T_{block_name}_{block_index} = {equations[sum(num_blocks[:block_type_index]) + block_index]}")
-                
-                # Display equations with a blank line between each equation
-                equations_text = '\n\n'.join(formatted_equations)
-                self.equation_text_edit.setPlainText(equations_text)
-
-                # Display result
-                self.result_text_edit.setPlainText(result)
-            else:
-                QMessageBox.warning(self, "Error", "Invalid input format.")
+            fields = {
+                "num_block_types": self.input_text_edit.toPlainText(),
+                "num_blocks": self.input_text_edit_2.toPlainText(),
+                "block_names": self.input_text_edit_3.toPlainText(),
+                "num_ad_types": self.input_text_edit_4.toPlainText(),
+                "ad_counts": self.input_text_edit_5.toPlainText(),
+                "ad_names": self.input_text_edit_6.toPlainText(),
+                "round_functions": self.input_text_edit_7.toPlainText(),
+                "ad_relations": self.input_text_edit_8.toPlainText(),
+            }
+            scheme = parse_scheme(fields, cipher_type)
         except Exception as e:
             QMessageBox.warning(self, "Error", str(e))
+            return
+
+        if self.result_cache is None:
+            from key_committing_tool_cache import ResultCache
+            self.result_cache = ResultCache()
+
+        # Run the analysis off the main thread so the window stays responsive
+        self.progress_info = {}
+        self.progress_label.setText("Analyzing...")
+        self.analyze_button.setEnabled(False)
+        self.cancel_button.setEnabled(True)
+        self.worker = AnalysisWorker(scheme, self.result_cache, self)
+        self.worker.progress.connect(self.show_progress)
+        self.worker.analysis_finished.connect(self.show_result)
+        self.worker.analysis_failed.connect(self.show_error)
+        self.worker.analysis_cancelled.connect(self.show_cancelled)
+        self.worker.finished.connect(self.analysis_done)
+        self.worker.start()
+
+    def cancel_analysis(self):
+        if self.worker is not None and self.worker.isRunning():
+            self.worker.requestInterruption()
+            self.progress_label.setText("Cancelling...")
+
+    def show_progress(self, stage, info):
+        self.progress_info.update(info)
+        lines = []
+        if "round" in self.progress_info:
+            lines.append(f"Round: {self.progress_info['round']}")
+        if "unknowns" in self.progress_info:
+            lines.append(f"Unknowns left: {self.progress_info['unknowns']}")
+        if "nodes" in self.progress_info:
+            lines.append(f"Search nodes: {self.progress_info['nodes']}")
+            lines.append(f"Guess depth: {self.progress_info['depth']}")
+        self.progress_label.setText('\n'.join(lines))
+
+    def show_result(self, result, equations, preview):
+        self.progress_label.setText("")
+        if "guesses" in result:
+            text = f"Attack rounds: {result['num_rounds']}\nUnknown values before guessing: {result['unknowns_before_guessing']}\nGuesses needed to resolve all unknowns: {format_guesses(result['guesses'])}"
+        elif "complexity" in result:
+            text = f"Attack rounds: {result['num_rounds']}\nComplexity: 2^{result['complexity']}"
+        else:
+            QMessageBox.warning(self, "Error", "Analysis cannot be performed.")
+            return
+        
+        if "stats" in result:
+            text += "\n\nStats:\n" + "\n".join(format_stats(result["stats"]))
+        else:
+            text += "\n\n(cached result)"
+        
+        # Display equations with a blank line between each equation
+        equations_text = '\n\n'.join(preview)
+        self.equation_text_edit.setPlainText(equations_text)
+        scheme = self.worker.scheme
+        self.saved_equations = (equations, scheme["block_names"], scheme["num_blocks"])
+        self.save_button.setEnabled(True)
+
+        # Display result
+        self.result_text_edit.setPlainText(text)
+
+    def save_equations(self):
+        if self.saved_equations is None:
+            return
+        path, _ = QFileDialog.getSaveFileName(self, "Save equations", "equations.txt", "Text files (*.txt);;All files (*)")
+        if not path:
+            return
+        equations, block_names, num_blocks = self.saved_equations
+        try:
+            with open(path, "w") as f:
+                write_equations(equations, block_names, num_blocks, f)
+        except OSError as e:
+            QMessageBox.warning(self, "Error", str(e))
+
+    def show_error(self, message):
+        self.progress_label.setText("")
+        QMessageBox.warning(self, "Error", message)
+
+    def show_cancelled(self):
+        self.progress_label.setText("Analysis cancelled.")
+
+    def analysis_done(self):
+        self.analyze_button.setEnabled(True)
+        self.cancel_button.setEnabled(False)
+        self.worker = None
+
+    def closeEvent(self, event):
+        if self.worker is not None and self.worker.isRunning():
+            self.worker.requestInterruption()
+            self.worker.wait()
+        super(KeyCommittingTool, self).closeEvent(event)
+
+class AnalysisWorker(QtCore.QThread):
+    progress = QtCore.pyqtSignal(str, dict)
+    analysis_finished = QtCore.pyqtSignal(object, object, object)
+    analysis_failed = QtCore.pyqtSignal(str)
+    analysis_cancelled = QtCore.pyqtSignal()
+
+    def __init__(self, scheme, cache, parent=None):
+        super(AnalysisWorker, self).__init__(parent)
+        self.scheme = scheme
+        self.cache = cache
+        self.last_report = 0.0
+
+    def report(self, stage, **info):
+        # Called from the analysis loops, which is where a cancel request takes effect
+        if self.isInterruptionRequested():
+            raise AnalysisCancelled()
+        now = time.monotonic()
+        if now - self.last_report >= 0.1:
+            self.last_report = now
+            self.progress.emit(stage, info)
+
+    def run(self):
+        from key_committing_tool_cache import cached_analysis
+        try:
+            result, equations = cached_analysis(self.scheme, self.cache, progress=self.report, stats=AnalysisStats())
+            # Only a bounded preview is rendered here; Save streams the full text
+            preview = preview_equations(equations, self.scheme["block_names"], self.scheme["num_blocks"], EQUATION_PREVIEW_CHARS)
+        except AnalysisCancelled:
+            self.analysis_cancelled.emit()
+        except Exception as e:
+            self.analysis_failed.emit(str(e))
+        else:
+            self.analysis_finished.emit(result, equations, preview)
 
 if __name__ == '__main__':
     app = QtWidgets.QApplication(sys.argv)
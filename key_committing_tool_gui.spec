@@ -3,15 +3,22 @@
 
 block_cipher = None
 
+# Compile the .ui file into key_committing_tool_ui.py, which the GUI loads
+# instead of parsing the XML at every launch
+from PyQt5 import uic
+with open('key_committing_tool_ui.py', 'w') as ui_module:
+    uic.compileUi('key_committing_tool.ui', ui_module)
+
 a = Analysis(
     ['key_committing_tool_gui.py'],
     pathex=[],
     binaries=[],
     datas=[('key_committing_tool.ui', '.')],
-    hiddenimports=[],
+    hiddenimports=['key_committing_tool_ui'],
     hookspath=[],
     runtime_hooks=[],
-    excludes=[],
+    # NumPy only speeds up the linear backend, which the GUI does not use
+    excludes=['numpy'],
     win_no_prefer_redirects=False,
     win_private_assemblies=False,
     cipher=block_cipher,
@@ -0,0 +1,173 @@
+import argparse
+import json
+import sys
+from key_committing_tool import SCHEME_DEFAULTS, BACKENDS, RoundLimitExceeded, RoundUnroller, parse_scheme, analyze_security, guessing_system
+
+# The round functions are the same every round, so once the unrolled system
+# is deep enough the outcome of propagation only moves along with the rounds.
+# An AD word is written as (AD type, round, word in round). The words resolved
+# in the first half of the rounds are kept as they are, and those in the second
+# half are counted back from the last round: when that signature repeats with
+# some period, larger round counts are filled in from it without unrolling.
+
+DEFAULT_CONFIRM = 3
+DEFAULT_MAX_PERIOD = 4
+
+def ad_word(name, ad_names, ad_counts):
+    ad_name, index = name.rsplit('_', 1)
+    ad_type = ad_names.index(ad_name)
+    return (ad_type,) + divmod(int(index), ad_counts[ad_type])
+
+def ad_word_name(ad_type, round_num, number, ad_names, ad_counts):
+    return f"{ad_names[ad_type]}_{ad_counts[ad_type] * round_num + number}"
+
+def round_signature(resolved, ad_names, ad_counts, num_rounds):
+    start = []
+    end = []
+    for name in resolved:
+        ad_type, round_num, number = ad_word(name, ad_names, ad_counts)
+        if round_num < num_rounds // 2:
+            start.append((ad_type, round_num, number))
+        else:
+            end.append((ad_type, num_rounds - 1 - round_num, number))
+    return tuple(sorted(start)), tuple(sorted(end))
+
+def signature_words(signature, ad_names, ad_counts, num_rounds):
+    start, end = signature
+    names = [ad_word_name(ad_type, round_num, number, ad_names, ad_counts) for ad_type, round_num, number in start]
+    names += [ad_word_name(ad_type, num_rounds - 1 - back, number, ad_names, ad_counts) for ad_type, back, number in end]
+    return names
+
+def find_period(signatures, first_round, confirm=DEFAULT_CONFIRM, max_period=DEFAULT_MAX_PERIOD):
+    # (round, period) from which the signature has repeated for confirm periods, or None.
+    # signatures[i] belongs to round first_round + i.
+    last = len(signatures) - 1
+    for period in range(1, max_period + 1):
+        steady = last - period
+        while steady >= 0 and signatures[steady] == signatures[steady + period]:
+            steady -= 1
+        steady += 1
+        if last - steady + 1 >= (confirm + 1) * period:
+            return first_round + steady, period
+    return None
+
+def round_outcome(scheme, equations, num_rounds, backend="propagation"):
+    # The AD words that the backend resolves, and whether that leaves nothing unknown
+    block_names = scheme["block_names"]
+    ad_names = scheme["ad_names"]
+    num_blocks = scheme["num_blocks"]
+    ad_counts = scheme["ad_counts"]
+    words = {ad_word_name(ad_type, round_num, number, ad_names, ad_counts) for ad_type in range(len(ad_names)) for round_num in range(num_rounds) for number in range(ad_counts[ad_type])}
+    if scheme["ad_relations"]:
+        system, _, unknown = guessing_system(equations, block_names, ad_names, num_blocks, ad_counts, num_rounds, relations=scheme["ad_relations"], backend=backend)
+        unresolved = system.values(unknown)
+        return sorted(words - unresolved), None
+    security_level = analyze_security(equations, block_names, ad_names, num_blocks, ad_counts, num_rounds, backend=backend)
+    if isinstance(security_level, int):
+        return sorted(words), security_level
+    return sorted(words - set(security_level)), None
+
+def round_result(scheme, num_rounds, resolved, complexity=None, extrapolated=False):
+    # Counts rather than lists of unknowns, so that a result does not grow with the rounds
+    num_words = sum(scheme["ad_counts"]) * num_rounds
+    result = {"name": scheme["name"], "num_rounds": num_rounds}
+    if complexity is not None:
+        result["complexity"] = complexity
+    elif scheme["ad_relations"]:
+        result["num_unknowns_before_guessing"] = num_words - len(resolved)
+    else:
+        result["num_unresolved"] = num_words - len(resolved)
+    result["resolved"] = sorted(resolved, key=lambda name: ad_word(name, scheme["ad_names"], scheme["ad_counts"]))
+    if extrapolated:
+        result["extrapolated"] = True
+    return result
+
+def iter_round_results(scheme, last_round, first_round=None, max_rounds=100, backend="propagation", extrapolate=True, confirm=DEFAULT_CONFIRM, max_period=DEFAULT_MAX_PERIOD, progress=None):
+    # One result per round count from first_round (default: the minimum rounds)
+    # to last_round. Rounds are unrolled and analyzed until the signature is
+    # steady; the rest are extrapolated from it at a constant cost per round.
+    ad_names = scheme["ad_names"]
+    ad_counts = scheme["ad_counts"]
+    unroller = RoundUnroller(scheme["round_functions"], scheme["block_names"], ad_names, ad_counts, scheme["num_blocks"])
+    while True:
+        if unroller.num_rounds >= max_rounds:
+            raise RoundLimitExceeded(f"Some equation still has no unknown value after {max_rounds} rounds")
+        unroller.step()
+        if unroller.all_contain_unknown():
+            break
+    if first_round is None:
+        first_round = unroller.num_rounds
+    # Fewer rounds leave an equation without unknowns, so there is nothing to analyze
+    first_round = max(first_round, unroller.num_rounds)
+    while unroller.num_rounds < first_round:
+        unroller.step()
+
+    # The complexity is kept with each signature, so that a repeating outcome
+    # is also of the same kind and extrapolated rows report it like analyzed ones
+    signatures = []
+    steady = None
+    for num_rounds in range(first_round, last_round + 1):
+        if steady is not None:
+            start, period = steady
+            signature, complexity = signatures[start - first_round + (num_rounds - start) % period]
+            yield round_result(scheme, num_rounds, signature_words(signature, ad_names, ad_counts, num_rounds), complexity, extrapolated=True)
+            continue
+        if num_rounds > unroller.num_rounds:
+            unroller.step()
+        resolved, complexity = round_outcome(scheme, unroller.equations, num_rounds, backend)
+        signatures.append((round_signature(resolved, ad_names, ad_counts, num_rounds), complexity))
+        if progress is not None:
+            progress("rounds", round=num_rounds)
+        yield round_result(scheme, num_rounds, resolved, complexity)
+        if extrapolate:
+            steady = find_period(signatures, first_round, confirm, max_period)
+            if steady is not None and progress is not None:
+                progress("steady", round=steady[0], period=steady[1])
+
+def main(argv=None):
+    from key_committing_tool_cli import load_scheme_file
+
+    parser = argparse.ArgumentParser(description="Analyze a scheme over a range of round counts, extrapolating once the outcome repeats.")
+    parser.add_argument("file", nargs="?", help="JSON or YAML file whose first scheme is analyzed")
+    parser.add_argument("-p", "--preset", choices=sorted(SCHEME_DEFAULTS), help="analyze a built-in scheme")
+    parser.add_argument("--from", dest="first_round", type=int, help="first round count (default: the minimum rounds)")
+    parser.add_argument("--to", dest="last_round", type=int, required=True, help="last round count")
+    parser.add_argument("--max-rounds", type=int, default=100, help="give up on schemes that need more rounds than this")
+    parser.add_argument("--backend", choices=BACKENDS, default="propagation", help="how unknowns are resolved")
+    parser.add_argument("--confirm", type=int, default=DEFAULT_CONFIRM, help="periods the outcome has to repeat before it is extrapolated")
+    parser.add_argument("--max-period", type=int, default=DEFAULT_MAX_PERIOD, help="longest period in rounds to look for")
+    parser.add_argument("--no-extrapolate", action="store_true", help="unroll and analyze every round count")
+    parser.add_argument("-o", "--output", help="write JSON lines here instead of stdout")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.preset:
+            scheme = parse_scheme(SCHEME_DEFAULTS[args.preset], args.preset)
+        elif args.file:
+            scheme = load_scheme_file(args.file)[0]
+        else:
+            parser.error("give a scheme file or --preset")
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    if args.confirm < 1 or args.max_period < 1:
+        parser.error("--confirm and --max-period must be at least 1")
+
+    def progress(kind, **info):
+        if kind == "steady":
+            print(f"{scheme['name']}: steady from round {info['round']} with period {info['period']}, extrapolating", file=sys.stderr)
+
+    out = open(args.output, "w") if args.output else sys.stdout
+    try:
+        for result in iter_round_results(scheme, args.last_round, args.first_round, args.max_rounds, args.backend, not args.no_extrapolate, args.confirm, args.max_period, progress):
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+    except ValueError as e:
+        print(f"{scheme['name']}: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,327 @@
+import argparse
+import json
+import sys
+import threading
+import time
+from key_committing_tool import SCHEME_DEFAULTS, BACKENDS, GuessSearch, iter_bits, parse_scheme, unroll_minimum_rounds, generate_equations, guessing_system
+
+# The minimum guess question as an implicit hitting set problem. The solver
+# proposes the smallest set of guesses that meets every cut found so far; the
+# tool's own propagation then either resolves everything from it or yields a
+# new cut: the unknowns outside a largest set of guesses that still leaves
+# something unresolved, one of which every solution has to guess. The cuts are
+# a plain MaxSAT / 0-1 program, which is what gets exported.
+
+SOLVERS = ("pysat", "ortools")
+
+class SolverTimeout(RuntimeError):
+    # The solver did not settle the minimum within the time limit
+    pass
+
+def remaining_time(deadline):
+    if deadline is None:
+        return None
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise SolverTimeout("the guess solver ran out of time")
+    return remaining
+
+class PySATHittingSets:
+    # A SAT solver with a totalizer over the guess variables; the size bound is
+    # an assumption, so the clauses learnt for one bound are kept for the next
+    def __init__(self, num_vars):
+        try:
+            from pysat.card import ITotalizer
+            from pysat.solvers import Solver
+        except ImportError:
+            raise ValueError("the pysat guess solver needs PySAT (pip install python-sat)")
+        self.num_vars = num_vars
+        self.totalizer = ITotalizer(lits=list(range(1, num_vars + 1)), ubound=num_vars)
+        self.solver = Solver(name="m22", bootstrap_with=self.totalizer.cnf.clauses)
+
+    def add_cut(self, indices):
+        self.solver.add_clause([i + 1 for i in indices])
+
+    def minimum(self, lower, deadline):
+        # Smallest hitting set, known to have at least lower variables; None if there is none
+        for bound in range(lower, self.num_vars + 1):
+            # rhs[k] is true when more than k variables are
+            assumptions = [-self.totalizer.rhs[bound]] if bound < self.num_vars else []
+            if self.solve(assumptions, deadline):
+                model = self.solver.get_model()
+                return [i for i in range(self.num_vars) if model[i] > 0]
+        return None
+
+    def all_of_size(self, size, deadline):
+        # Every hitting set of that size; each one found is blocked for later calls
+        assumptions = [-self.totalizer.rhs[size]] if size < self.num_vars else []
+        found = []
+        while self.solve(assumptions, deadline):
+            model = self.solver.get_model()
+            chosen = [i for i in range(self.num_vars) if model[i] > 0]
+            found.append(chosen)
+            self.solver.add_clause([i + 1 for i in range(self.num_vars) if model[i] < 0])
+        return found
+
+    def solve(self, assumptions, deadline):
+        remaining = remaining_time(deadline)
+        if remaining is None:
+            return self.solver.solve(assumptions=assumptions)
+        timer = threading.Timer(remaining, self.solver.interrupt)
+        timer.start()
+        try:
+            result = self.solver.solve_limited(assumptions=assumptions, expect_interrupt=True)
+        finally:
+            timer.cancel()
+        self.solver.clear_interrupt()
+        if result is None:
+            raise SolverTimeout("the guess solver ran out of time")
+        return result
+
+    def close(self):
+        self.solver.delete()
+        self.totalizer.delete()
+
+class ORToolsHittingSets:
+    # CP-SAT minimizing the number of guesses; the model grows by one clause per cut
+    def __init__(self, num_vars):
+        try:
+            from ortools.sat.python import cp_model
+        except ImportError:
+            raise ValueError("the ortools guess solver needs OR-Tools (pip install ortools)")
+
+        class SolutionCollector(cp_model.CpSolverSolutionCallback):
+            def __init__(self, variables):
+                super().__init__()
+                self.variables = variables
+                self.found = []
+
+            def on_solution_callback(self):
+                self.found.append([i for i, var in enumerate(self.variables) if self.value(var)])
+
+        self.collector_class = SolutionCollector
+        self.cp_model = cp_model
+        self.model = cp_model.CpModel()
+        self.vars = [self.model.new_bool_var(f"g{i}") for i in range(num_vars)]
+        self.model.minimize(sum(self.vars))
+        self.size = None
+
+    def add_cut(self, indices):
+        self.model.add_bool_or([self.vars[i] for i in indices])
+
+    def minimum(self, lower, deadline):
+        solver = self.solver(deadline)
+        status = solver.solve(self.model)
+        if status == self.cp_model.OPTIMAL:
+            return [i for i, var in enumerate(self.vars) if solver.value(var)]
+        if status == self.cp_model.INFEASIBLE:
+            return None
+        raise SolverTimeout("the guess solver ran out of time")
+
+    def all_of_size(self, size, deadline):
+        # Every hitting set of that size in one search; the model is only used
+        # for this size from then on
+        if self.size is None:
+            self.size = size
+            self.model.clear_objective()
+            self.model.add(sum(self.vars) == size)
+        collector = self.collector_class(self.vars)
+        solver = self.solver(deadline)
+        solver.parameters.enumerate_all_solutions = True
+        status = solver.solve(self.model, collector)
+        if status not in (self.cp_model.OPTIMAL, self.cp_model.INFEASIBLE):
+            raise SolverTimeout("the guess solver ran out of time")
+        return collector.found
+
+    def solver(self, deadline):
+        solver = self.cp_model.CpSolver()
+        remaining = remaining_time(deadline)
+        if remaining is not None:
+            solver.parameters.max_time_in_seconds = remaining
+        return solver
+
+    def close(self):
+        pass
+
+HITTING_SET_SOLVERS = {"pysat": PySATHittingSets, "ortools": ORToolsHittingSets}
+
+class GuessModel:
+    # Guess variable i stands for the unknown at bit self.bits[i] of the system
+    def __init__(self, system, known, unknown, backend="propagation"):
+        self.system = system
+        self.known = known
+        self.bits = list(iter_bits(unknown))
+        self.search = GuessSearch(system, known | unknown, backend=backend)
+        self.cuts = []
+        self.solutions = []
+        self.iterations = 0
+
+    @property
+    def names(self):
+        return [self.system.names[bit] for bit in self.bits]
+
+    def guess_mask(self, indices):
+        mask = 0
+        for i in indices:
+            mask |= 1 << self.bits[i]
+        return mask
+
+    def cut(self, known):
+        # Guess more unknowns for as long as something stays unresolved
+        for bit in self.bits:
+            if not known >> bit & 1:
+                grown = self.search.closure(known, 1 << bit)
+                if grown != self.search.all_values:
+                    known = grown
+        return [i for i, bit in enumerate(self.bits) if not known >> bit & 1]
+
+    def check(self, chosen, hitting_sets):
+        # Propagate from the proposed guesses; a solution is blocked, anything
+        # else gives a cut that the proposal does not meet
+        self.iterations += 1
+        known = self.search.closure(self.known, self.guess_mask(chosen))
+        if known == self.search.all_values:
+            self.solutions.append(chosen)
+            chosen = set(chosen)
+            hitting_sets.add_cut([i for i in range(len(self.bits)) if i not in chosen])
+            return None
+        cut = self.cut(known)
+        self.cuts.append(cut)
+        hitting_sets.add_cut(cut)
+        return cut
+
+    def solve(self, solver="pysat", time_limit=None, progress=None):
+        # Finds every minimum guess set
+        if solver not in HITTING_SET_SOLVERS:
+            raise ValueError(f"Unknown guess solver {solver!r}, expected one of {', '.join(SOLVERS)}")
+        deadline = None if time_limit is None else time.monotonic() + time_limit
+        hitting_sets = HITTING_SET_SOLVERS[solver](len(self.bits))
+
+        def report(size):
+            if progress is not None:
+                progress("guess", depth=size, nodes=self.iterations, unknowns=len(self.bits))
+
+        try:
+            for cut in self.cuts:
+                hitting_sets.add_cut(cut)
+            # The smallest hitting set only grows as cuts are added, so the
+            # first one that resolves everything has the minimum size
+            size = 0
+            while not self.solutions:
+                chosen = hitting_sets.minimum(size, deadline)
+                if chosen is None:
+                    break
+                size = len(chosen)
+                self.check(chosen, hitting_sets)
+                report(size)
+            # Then every other set of that size that meets all cuts, in batches
+            while self.solutions:
+                batch = hitting_sets.all_of_size(size, deadline)
+                if not batch:
+                    break
+                new_cuts = []
+                for chosen in batch:
+                    # Skip sets that a cut found earlier in this batch already rules out
+                    if all(any(i in cut for i in chosen) for cut in new_cuts):
+                        cut = self.check(chosen, hitting_sets)
+                        if cut is not None:
+                            new_cuts.append(set(cut))
+                report(size)
+        finally:
+            hitting_sets.close()
+        names = self.names
+        return sorted(sorted(names[i] for i in chosen) for chosen in self.solutions)
+
+    def write_wcnf(self, out):
+        # Hard clauses are the cuts, and each guess costs 1
+        names = self.names
+        top = len(names) + 1
+        out.write("c minimum guesses: variable i true means guessing the value on line i below\n")
+        for i, name in enumerate(names):
+            out.write(f"c {i + 1} {name}\n")
+        out.write(f"p wcnf {len(names)} {len(self.cuts) + len(names)} {top}\n")
+        for cut in self.cuts:
+            out.write(f"{top} {' '.join(str(i + 1) for i in cut)} 0\n")
+        for i in range(len(names)):
+            out.write(f"1 -{i + 1} 0\n")
+
+    def write_lp(self, out):
+        names = self.names
+        out.write("\\ minimum guesses: a variable is 1 when that value is guessed\n")
+        out.write("Minimize\n")
+        out.write(f" guesses: {' + '.join(names)}\n")
+        out.write("Subject To\n")
+        for k, cut in enumerate(self.cuts):
+            out.write(f" cut{k + 1}: {' + '.join(names[i] for i in cut)} >= 1\n")
+        out.write("Binary\n")
+        for name in names:
+            out.write(f" {name}\n")
+        out.write("End\n")
+
+def solver_minimum_guesses(system, known, unknown, solver="pysat", time_limit=None, progress=None, backend="propagation"):
+    # Same result as find_minimum_guesses
+    return GuessModel(system, known, unknown, backend).solve(solver, time_limit, progress)
+
+def main(argv=None):
+    from key_committing_tool_cli import load_scheme_file
+
+    parser = argparse.ArgumentParser(description="Find the minimum guesses of a scheme with a SAT or CP solver and export the problem.")
+    parser.add_argument("file", nargs="?", help="JSON or YAML file whose first scheme is analyzed")
+    parser.add_argument("-p", "--preset", choices=sorted(SCHEME_DEFAULTS), help="analyze a built-in scheme")
+    parser.add_argument("--rounds", type=int, help="unroll this many rounds instead of the minimum")
+    parser.add_argument("--max-rounds", type=int, default=100, help="give up on schemes that need more rounds than this")
+    parser.add_argument("--solver", choices=SOLVERS, default="pysat", help="solver for the hitting set problem")
+    parser.add_argument("--backend", choices=BACKENDS, default="propagation", help="how unknowns are resolved before and after each guess")
+    parser.add_argument("--time-limit", type=float, metavar="SECONDS", help="stop the solver after this long")
+    parser.add_argument("--wcnf", metavar="FILE", help="write the cuts as a weighted MaxSAT problem (DIMACS WCNF)")
+    parser.add_argument("--lp", metavar="FILE", help="write the cuts as a 0-1 program (CPLEX LP format)")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.preset:
+            scheme = parse_scheme(SCHEME_DEFAULTS[args.preset], args.preset)
+        elif args.file:
+            scheme = load_scheme_file(args.file)[0]
+        else:
+            parser.error("give a scheme file or --preset")
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    block_names = scheme["block_names"]
+    ad_names = scheme["ad_names"]
+    num_blocks = scheme["num_blocks"]
+    ad_counts = scheme["ad_counts"]
+    try:
+        if args.rounds is None:
+            num_rounds, equations = unroll_minimum_rounds(block_names, ad_names, num_blocks, ad_counts, scheme["round_functions"], args.max_rounds)
+        else:
+            num_rounds = args.rounds
+            equations = generate_equations(scheme["round_functions"], block_names, ad_names, ad_counts, num_blocks, num_rounds)
+        system, known, unknown = guessing_system(equations, block_names, ad_names, num_blocks, ad_counts, num_rounds, relations=scheme["ad_relations"], backend=args.backend)
+    except ValueError as e:
+        print(f"{scheme['name']}: {e}", file=sys.stderr)
+        return 1
+
+    model = GuessModel(system, known, unknown, args.backend)
+    result = {"name": scheme["name"], "num_rounds": num_rounds}
+    if args.backend != "propagation":
+        result["backend"] = args.backend
+    result["unknowns_before_guessing"] = sorted(system.values(unknown))
+    status = 0
+    try:
+        result["guesses"] = model.solve(args.solver, args.time_limit) if unknown else []
+    except (SolverTimeout, ValueError) as e:
+        print(f"{scheme['name']}: {e}", file=sys.stderr)
+        result = None
+        status = 1
+    # After a timeout the cuts found so far still make a valid, if weaker, problem
+    for path, write in ((args.wcnf, model.write_wcnf), (args.lp, model.write_lp)):
+        if path:
+            with open(path, "w") as f:
+                write(f)
+    if result is not None:
+        print(json.dumps(result))
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
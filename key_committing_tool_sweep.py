@@ -0,0 +1,397 @@
+import argparse
+import itertools
+import json
+import os
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from key_committing_tool import SCHEME_DEFAULTS, BACKENDS, STATE_SLOT, RoundLimitExceeded, parse_scheme, resolve_reference, run_analysis
+from key_committing_tool_expr import tokenize
+from key_committing_tool_cli import load_scheme_file
+
+# Round functions are handled as token lists in which a state block is
+# (BLOCK, block type, index), an AD word is (AD, AD type) and everything else
+# is the syntax token itself. AD words are numbered again when a variant is
+# rendered, since only how many of each type a function takes matters.
+BLOCK = 'block'
+RELATIVE = 'relative'
+AD = 'ad'
+
+def block_starts(num_blocks):
+    starts = []
+    total = 0
+    for count in num_blocks:
+        starts.append(total)
+        total += count
+    return starts
+
+def layout_from_scheme(scheme):
+    block_names = scheme["block_names"]
+    num_blocks = scheme["num_blocks"]
+    starts = block_starts(num_blocks)
+    functions = []
+    for func in scheme["round_functions"]:
+        tokens = []
+        for token in tokenize(func):
+            if token in ('A(', '(', ')', '+'):
+                tokens.append(token)
+                continue
+            ref = resolve_reference(token, block_names, num_blocks, scheme["ad_names"], scheme["ad_counts"])
+            if ref[0] == STATE_SLOT:
+                block_type = max(t for t, start in enumerate(starts) if start <= ref[1])
+                tokens.append((BLOCK, block_type, ref[1] - starts[block_type]))
+            else:
+                tokens.append((AD, ref[1]))
+        functions.append(tokens)
+
+    # An AD type is moved and added within the block type it is injected into first
+    homes = []
+    for ad_type in range(len(scheme["ad_names"])):
+        hosts = [i for i, tokens in enumerate(functions) if (AD, ad_type) in tokens]
+        home = max(t for t, start in enumerate(starts) if start <= hosts[0]) if hosts else min(ad_type, len(num_blocks) - 1)
+        homes.append(home)
+    return {
+        "name": scheme["name"],
+        "block_names": block_names,
+        "num_blocks": list(num_blocks),
+        "ad_names": scheme["ad_names"],
+        "ad_homes": homes,
+        "functions": functions,
+        "ad_relations": scheme["ad_relations"],
+    }
+
+def ad_hosts(layout, ad_type):
+    # Function index once per AD word of the type
+    return [i for i, tokens in enumerate(layout["functions"]) for token in tokens if token == (AD, ad_type)]
+
+def remove_ad(tokens, ad_type):
+    # Drop the last word of the type together with the '+' next to it
+    i = len(tokens) - 1 - tokens[::-1].index((AD, ad_type))
+    if i > 0 and tokens[i - 1] == '+':
+        return tokens[:i - 1] + tokens[i + 1:]
+    if i + 1 < len(tokens) and tokens[i + 1] == '+':
+        return tokens[:i] + tokens[i + 2:]
+    return tokens[:i] + tokens[i + 1:]
+
+def add_ad(tokens, ad_type):
+    return tokens + ['+', (AD, ad_type)] if tokens else [(AD, ad_type)]
+
+def place_ads(layout, ad_type, hosts):
+    # Functions keep their tokens unless the number of words of the type they take changes
+    wanted = Counter(hosts)
+    current = Counter(ad_hosts(layout, ad_type))
+    functions = []
+    for i, tokens in enumerate(layout["functions"]):
+        for _ in range(current[i] - wanted[i]):
+            tokens = remove_ad(tokens, ad_type)
+        for _ in range(wanted[i] - current[i]):
+            tokens = add_ad(tokens, ad_type)
+        functions.append(tokens)
+    return dict(layout, functions=functions)
+
+def resize(layout, num_blocks):
+    # References within a block type are kept relative to the function's own
+    # block, so a ring of A(S{i-1})+S{i} stays a ring. New blocks take the most
+    # common function of their type that injects no AD.
+    old_starts = block_starts(layout["num_blocks"])
+    functions = []
+    for block_type, new_count in enumerate(num_blocks):
+        old_count = layout["num_blocks"][block_type]
+        relative = []
+        for i in range(old_count):
+            tokens = []
+            for token in layout["functions"][old_starts[block_type] + i]:
+                if isinstance(token, tuple) and token[0] == BLOCK and token[1] == block_type:
+                    offset = (token[2] - i) % old_count
+                    if offset > old_count // 2:
+                        offset -= old_count
+                    token = (RELATIVE, offset)
+                tokens.append(token)
+            relative.append(tokens)
+        plain = [tuple(tokens) for tokens in relative if not any(isinstance(token, tuple) and token[0] == AD for token in tokens)]
+        if plain:
+            filler = list(Counter(plain).most_common(1)[0][0])
+        else:
+            filler = relative[-1]
+            for ad_type in {token[1] for token in filler if isinstance(token, tuple) and token[0] == AD}:
+                while (AD, ad_type) in filler:
+                    filler = remove_ad(filler, ad_type)
+        for i in range(new_count):
+            tokens = []
+            for token in relative[i] if i < old_count else filler:
+                if isinstance(token, tuple) and token[0] == RELATIVE:
+                    token = (BLOCK, block_type, (i + token[1]) % new_count)
+                elif isinstance(token, tuple) and token[0] == BLOCK and token[2] >= num_blocks[token[1]]:
+                    raise ValueError(f"{layout['block_names'][token[1]]}{token[2]} does not exist with {num_blocks[token[1]]} blocks")
+                tokens.append(token)
+            functions.append(tokens)
+    return dict(layout, num_blocks=list(num_blocks), functions=functions)
+
+def set_ad_counts(layout, ad_counts):
+    # Extra words are taken from the last functions that inject the type;
+    # missing ones go to evenly spaced free blocks of the type's home
+    starts = block_starts(layout["num_blocks"])
+    for ad_type, count in enumerate(ad_counts):
+        hosts = ad_hosts(layout, ad_type)
+        del hosts[count:]
+        home = layout["ad_homes"][ad_type]
+        size = layout["num_blocks"][home]
+        for i in range(count):
+            slot = starts[home] + i * size // count
+            if len(hosts) < count and slot not in hosts:
+                hosts.append(slot)
+        free = [block for block in range(starts[home], starts[home] + size) if block not in hosts]
+        while len(hosts) < count:
+            hosts.append(free.pop(0) if free else starts[home])
+        layout = place_ads(layout, ad_type, hosts)
+    return layout
+
+def place_all(layout, hosts_by_type):
+    for ad_type, hosts in enumerate(hosts_by_type):
+        layout = place_ads(layout, ad_type, hosts)
+    return layout
+
+def ad_placements(layout):
+    # Every choice of distinct host blocks within its home for each AD type
+    starts = block_starts(layout["num_blocks"])
+    choices = []
+    for ad_type in range(len(layout["ad_names"])):
+        home = layout["ad_homes"][ad_type]
+        count = len(ad_hosts(layout, ad_type))
+        choices.append(list(itertools.combinations(range(starts[home], starts[home] + layout["num_blocks"][home]), count)))
+    return itertools.product(*choices)
+
+def render(layout, rotation=None, numbered=True):
+    # Round function strings; rotation shifts the blocks of each type cyclically
+    num_blocks = layout["num_blocks"]
+    starts = block_starts(num_blocks)
+    rotation = rotation or [0] * len(num_blocks)
+    functions = [None] * len(layout["functions"])
+    next_word = [0] * len(layout["ad_names"])
+    for block_type, count in enumerate(num_blocks):
+        for i in range(count):
+            parts = []
+            for token in layout["functions"][starts[block_type] + i]:
+                if isinstance(token, str):
+                    parts.append(token)
+                elif token[0] == BLOCK:
+                    parts.append(f"{layout['block_names'][token[1]]}{(token[2] + rotation[token[1]]) % num_blocks[token[1]]}")
+                elif numbered:
+                    parts.append(f"{layout['ad_names'][token[1]]}{next_word[token[1]]}")
+                    next_word[token[1]] += 1
+                else:
+                    parts.append(layout["ad_names"][token[1]])
+            functions[starts[block_type] + (i + rotation[block_type]) % count] = ''.join(parts)
+    return functions
+
+def canonical_key(layout):
+    # The same scheme up to a cyclic relabelling of the blocks of each type
+    rotations = itertools.product(*(range(count) for count in layout["num_blocks"]))
+    return min('\n'.join(render(layout, rotation, numbered=False)) for rotation in rotations)
+
+def variant_name(layout):
+    starts = block_starts(layout["num_blocks"])
+    labels = []
+    for ad_type, ad_name in enumerate(layout["ad_names"]):
+        hosts = []
+        for host in ad_hosts(layout, ad_type):
+            block_type = max(t for t, start in enumerate(starts) if start <= host)
+            hosts.append(f"{layout['block_names'][block_type]}{host - starts[block_type]}")
+        labels.append(f"{ad_name}@{','.join(hosts) or '-'}")
+    return f"{layout['name']} [{' '.join(map(str, layout['num_blocks']))} blocks, {' '.join(labels)}]"
+
+def to_scheme(layout):
+    fields = {
+        "num_blocks": layout["num_blocks"],
+        "block_names": layout["block_names"],
+        "ad_counts": [len(ad_hosts(layout, ad_type)) for ad_type in range(len(layout["ad_names"]))],
+        "ad_names": layout["ad_names"],
+        "round_functions": render(layout),
+        "ad_relations": layout["ad_relations"],
+    }
+    return parse_scheme(fields, variant_name(layout))
+
+def variant_error(name, error, round_functions=()):
+    # Stands in for a variant that cannot be built, so that it is reported like a failed analysis
+    return {"name": name, "round_functions": list(round_functions), "error": str(error)}
+
+def iter_variants(base, num_blocks=None, ad_counts=None, ad_positions=False, max_variants=None):
+    # Variants of base, each structure once up to rotating the blocks of a type.
+    # A variant that cannot be built is yielded as a variant_error record.
+    layout = layout_from_scheme(base)
+    base_counts = [len(ad_hosts(layout, ad_type)) for ad_type in range(len(layout["ad_names"]))]
+    seen = set()
+    produced = 0
+    for block_option in num_blocks or [layout["num_blocks"]]:
+        try:
+            resized = layout if block_option == layout["num_blocks"] else resize(layout, block_option)
+        except ValueError as e:
+            yield variant_error(f"{layout['name']} [{' '.join(map(str, block_option))} blocks]", e)
+            continue
+        for count_option in ad_counts or [base_counts]:
+            counted = set_ad_counts(resized, count_option)
+            candidates = [counted]
+            if ad_positions:
+                candidates = itertools.chain(candidates, (place_all(counted, hosts) for hosts in ad_placements(counted)))
+            for candidate in candidates:
+                key = canonical_key(candidate)
+                if key in seen:
+                    continue
+                seen.add(key)
+                try:
+                    scheme = to_scheme(candidate)
+                except ValueError as e:
+                    yield variant_error(variant_name(candidate), e, render(candidate))
+                    continue
+                yield scheme
+                produced += 1
+                if max_variants is not None and produced >= max_variants:
+                    return
+
+def is_attack(result):
+    # Whether the analysis found a complete attack, not just the rounds
+    if "complexity" in result:
+        return True
+    if "guesses" in result:
+        return not result["unknowns_before_guessing"] or bool(result["guesses"])
+    return False
+
+def rank_key(result):
+    # Complete attacks first: fewer rounds, then lower complexity or fewer guesses.
+    # Results without an attack come after all of them, whatever their rounds.
+    if "num_rounds" not in result:
+        return (2, float('inf'), 0, 0)
+    if not is_attack(result):
+        if "guesses" in result:
+            return (1, result["num_rounds"], 1, len(result["unknowns_before_guessing"]))
+        return (1, result["num_rounds"], 0, len(result["unresolved"]))
+    if "complexity" in result:
+        return (0, result["num_rounds"], 0, result["complexity"])
+    if not result["unknowns_before_guessing"]:
+        return (0, result["num_rounds"], 1, 0)
+    return (0, result["num_rounds"], 1, len(result["guesses"][0]))
+
+def sweep_job(scheme, max_rounds, pruned_at, backend):
+    if "error" in scheme:
+        return {"name": scheme["name"], "error": scheme["error"]}
+    try:
+        result, _ = run_analysis(scheme, max_rounds, backend=backend)
+        return result
+    except RoundLimitExceeded as e:
+        if pruned_at is not None:
+            return {"name": scheme["name"], "pruned": pruned_at}
+        return {"name": scheme["name"], "error": str(e)}
+    except Exception as e:
+        return {"name": scheme["name"], "error": str(e)}
+
+def iter_sweep(variants, jobs=1, max_rounds=100, prune=True, backend="propagation"):
+    # (scheme, result) pairs in completion order. With prune, a variant is
+    # only unrolled up to the rounds of the best complete attack found so far,
+    # since one that needs more rounds cannot beat it.
+    best = None
+    variants = iter(variants)
+
+    def limits():
+        if prune and best is not None and best[1] < max_rounds:
+            return best[1], best[1]
+        return max_rounds, None
+
+    def record(result):
+        # Only a complete attack bounds the rounds worth unrolling
+        nonlocal best
+        if is_attack(result) and (best is None or rank_key(result) < best):
+            best = rank_key(result)
+
+    if jobs == 1:
+        for scheme in variants:
+            result = sweep_job(scheme, *limits(), backend)
+            record(result)
+            yield scheme, result
+        return
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        # Submitting lazily lets later variants use the tighter limit
+        pending = {}
+        for scheme in itertools.islice(variants, 2 * jobs):
+            pending[executor.submit(sweep_job, scheme, *limits(), backend)] = scheme
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                scheme = pending.pop(future)
+                result = future.result()
+                record(result)
+                yield scheme, result
+                for scheme in itertools.islice(variants, 1):
+                    pending[executor.submit(sweep_job, scheme, *limits(), backend)] = scheme
+
+def describe(result):
+    if "complexity" in result:
+        return f"2^{result['complexity']}"
+    if "guesses" in result:
+        if not result["unknowns_before_guessing"]:
+            return "no guesses needed"
+        if not result["guesses"]:
+            return "no guess set found"
+        return f"guess {len(result['guesses'][0])} ({len(result['guesses'])} choices)"
+    if "unresolved" in result:
+        return f"{len(result['unresolved'])} unresolved"
+    if "pruned" in result:
+        return f"pruned (> {result['pruned']} rounds)"
+    return f"error: {result['error']}"
+
+def format_table(ranked):
+    lines = [f"{'rank':>4}  {'rounds':>6}  {'attack':<24}  variant"]
+    for rank, (scheme, result) in enumerate(ranked, 1):
+        lines.append(f"{rank:>4}  {result.get('num_rounds', '-'):>6}  {describe(result):<24}  {scheme['name']}")
+    return lines
+
+def parse_counts(values):
+    return [list(map(int, value.replace(',', ' ').split())) for value in values]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze variants of a scheme and rank them by the cheapest key committing attack.")
+    parser.add_argument("file", nargs="?", help="JSON or YAML file whose first scheme is the base")
+    parser.add_argument("-p", "--preset", choices=sorted(SCHEME_DEFAULTS), help="use a built-in scheme as the base")
+    parser.add_argument("--num-blocks", action="append", default=[], metavar="COUNTS", help="block counts per block type to try, e.g. '6' or '3 4 6' (repeatable)")
+    parser.add_argument("--ad-counts", action="append", default=[], metavar="COUNTS", help="AD words per round for each AD type to try (repeatable)")
+    parser.add_argument("--ad-positions", action="store_true", help="try every choice of blocks the AD words are injected into")
+    parser.add_argument("--max-variants", type=int, help="stop after this many distinct variants")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="number of worker processes (0 = one per CPU)")
+    parser.add_argument("--max-rounds", type=int, default=100, help="give up on variants that need more rounds than this")
+    parser.add_argument("--no-prune", action="store_true", help="analyze every variant fully, even those that cannot beat the best attack")
+    parser.add_argument("--backend", choices=BACKENDS, default="propagation", help="how unknowns are resolved, also after each guess for schemes with an AD relation")
+    parser.add_argument("-o", "--output", help="also write the ranked results as JSON lines here")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.preset:
+            base = parse_scheme(SCHEME_DEFAULTS[args.preset], args.preset)
+        elif args.file:
+            base = load_scheme_file(args.file)[0]
+        else:
+            parser.error("give a scheme file or --preset")
+        num_blocks = parse_counts(args.num_blocks)
+        ad_counts = parse_counts(args.ad_counts)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    if any(len(counts) != len(base["block_names"]) for counts in num_blocks):
+        parser.error(f"--num-blocks needs {len(base['block_names'])} counts")
+    if any(len(counts) != len(base["ad_names"]) for counts in ad_counts):
+        parser.error(f"--ad-counts needs {len(base['ad_names'])} counts")
+
+    jobs = args.jobs if args.jobs > 0 else os.cpu_count() or 1
+    variants = iter_variants(base, num_blocks, ad_counts, args.ad_positions, args.max_variants)
+    results = []
+    for scheme, result in iter_sweep(variants, jobs, args.max_rounds, not args.no_prune, args.backend):
+        results.append((scheme, result))
+        print(f"{scheme['name']}: {describe(result)}", file=sys.stderr)
+
+    ranked = sorted(results, key=lambda item: rank_key(item[1]))
+    print('\n'.join(format_table(ranked)))
+    if args.output:
+        with open(args.output, "w") as f:
+            for scheme, result in ranked:
+                f.write(json.dumps(dict(result, round_functions=scheme["round_functions"])) + "\n")
+    return 1 if any("error" in result for _, result in results) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,44 @@
+import unittest
+from key_committing_tool import SCHEME_DEFAULTS, parse_scheme, generate_equations, analyze_guessing, run_analysis
+
+def unrolled(scheme, num_rounds):
+    return generate_equations(scheme["round_functions"], scheme["block_names"], scheme["ad_names"], scheme["ad_counts"], scheme["num_blocks"], num_rounds)
+
+class PresetTest(unittest.TestCase):
+    def test_rounds_and_complexity(self):
+        expected = {"AEGIS-128": (5, 0), "AEGIS-128L": (4, 0), "AEGIS-256": (6, 0), "Rocca": (3, 128), "Rocca-S": (3, 64)}
+        for name, (num_rounds, complexity) in expected.items():
+            result, _ = run_analysis(parse_scheme(SCHEME_DEFAULTS[name], name))
+            self.assertEqual((result["num_rounds"], result["complexity"]), (num_rounds, complexity), name)
+
+    def test_tiaoxin_guesses(self):
+        result, _ = run_analysis(parse_scheme(SCHEME_DEFAULTS["Tiaoxin-346"], "Tiaoxin-346"))
+        self.assertEqual(result["num_rounds"], 6)
+        self.assertEqual(result["unknowns_before_guessing"], ["a_0", "a_1", "a_2", "a_4", "a_5", "b_0", "b_1", "b_2", "b_4", "b_5"])
+        self.assertEqual(result["guesses"], [["a_0"], ["a_4"], ["b_0"], ["b_4"]])
+
+    def test_tiaoxin_guesses_at_7_rounds(self):
+        scheme = parse_scheme(SCHEME_DEFAULTS["Tiaoxin-346"], "Tiaoxin-346")
+        unknowns, guesses = analyze_guessing(unrolled(scheme, 7), scheme["block_names"], scheme["ad_names"], scheme["num_blocks"], scheme["ad_counts"], 7, relations=scheme["ad_relations"])
+        self.assertEqual(unknowns, ["a_0", "a_1", "a_2", "a_3", "a_4", "a_5", "a_6", "b_0", "b_1", "b_2", "b_3", "b_4", "b_5", "b_6", "c_0", "c_1", "c_6"])
+        self.assertEqual(len(guesses), 86)
+        self.assertEqual(guesses[:3], [["a_0", "a_1", "a_4"], ["a_0", "a_1", "b_0"], ["a_0", "a_1", "b_1"]])
+
+class CustomSchemeTest(unittest.TestCase):
+    def test_repeated_outer_a(self):
+        # The string based remove_outer_A turned A(x)+A(y) into x)+A(y, which
+        # resolved every AD word here
+        scheme = parse_scheme({"num_blocks": [3], "block_names": ["S"], "ad_counts": [2], "ad_names": ["AD"], "round_functions": ["A(S1)+S0+A(S1)", "A(S1)+A(S2)+AD0", "AD1+S1"]}, "outer-a")
+        result, _ = run_analysis(scheme)
+        self.assertEqual(result["num_rounds"], 2)
+        self.assertEqual(result["unresolved"], ["AD_1", "AD_2"])
+
+    def test_block_names_are_whole_tokens(self):
+        # S1 must not match the start of S10
+        round_functions = ["A(S10)+AD0"] + [f"S{i - 1}" for i in range(1, 11)]
+        scheme = parse_scheme({"num_blocks": [11], "block_names": ["S"], "ad_counts": [1], "ad_names": ["AD"], "round_functions": round_functions}, "s10")
+        self.assertEqual(str(unrolled(scheme, 1)[0]), "A(S_10)+AD_0")
+        self.assertEqual([str(eq) for eq in unrolled(scheme, 2)[:2]], ["A(S_9)+AD_1", "A(S_10)+AD_0"])
+
+if __name__ == '__main__':
+    unittest.main()